@@ -2,11 +2,14 @@
 import os
 from flask import Flask
 from dotenv import load_dotenv
-from app.services.guardrail_service import ensure_cache_dir
-from app.services.tts_service import ensure_generated_dir
 
+# Before the service imports: they read their ROAST_* settings at import time
 load_dotenv()
 
+from app.services.guardrail_service import cache_checker, ensure_cache_dir
+from app.services.tts_service import ensure_generated_dir
+from app.services.cache_service import cache_sweeper
+
 
 def create_app(test_config=None):
     # Create and configure the app
@@ -21,6 +24,10 @@ def create_app(test_config=None):
     # Ensure cache and generated dirs exist
     ensure_cache_dir()
     ensure_generated_dir()
+
+    # Run in every gunicorn worker; sweeps are serialized through lock files
+    cache_checker.start()
+    cache_sweeper.start()
     
     # Register Blueprints
     from app import routes
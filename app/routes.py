@@ -1,21 +1,34 @@
 
-from flask import Blueprint, render_template, request, jsonify, redirect, url_for, send_from_directory
+from flask import Blueprint, Response, render_template, request, jsonify, redirect, url_for, send_from_directory
 import os
-import threading
+import gzip
+import json
+import time
+import hashlib
+try:
+    import brotli  # Optional: better ratios than gzip when installed
+except ImportError:
+    brotli = None
 
-from app.services.github_service import ingest_repo
-from app.services.classifier_service import classify_file
-from app.services.blueprint_service import generate_blueprint
 from app.services.guardrail_service import (
-    Guardrail, get_repo_hash, get_cached_result, save_result, 
-    estimate_and_prune, get_repo_data, save_repo_data
+    get_cached_result, get_repo_data, get_repo_file, has_repo_data, list_repo_paths, memory_cache,
+    snapshot_validator
 )
-from app.services.ai_service import AIService
-from app.services.tts_service import TTSService
+from app.services.cache_service import record_access
+from app.services.github_service import validate_repo_url
+from app.services.metrics_service import metrics, render_prometheus
+from app.services.scheduler_service import SchedulerBusy
+from app.services.storage_service import ensure_local
+from app.services.tts_service import GENERATED_DIR, generated_key
+from app.services.job_service import JobManager
+from app.services.pipeline_service import lookup_cached_roast, run_roast_pipeline
 
 bp = Blueprint('main', __name__)
-ai_service = AIService()
-tts_service = TTSService()
+job_manager = JobManager(run_roast_pipeline)
+
+# SSE streams hold a thread, so they are capped; clients reconnect or fall back to polling
+SSE_MAX_SECONDS = 300
+SSE_HEARTBEAT_SECONDS = 15
 
 @bp.route('/')
 def index():
@@ -30,71 +43,113 @@ def health_check():
         "version": "1.0.0"
     }), 200
 
+@bp.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint: stage timings, peak memory and counters of every worker"""
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 @bp.route('/ignite', methods=['POST'])
 def ignite():
     data = request.json
     repo_url = data.get('repo_url')
     
-    if not repo_url:
-        return jsonify({"error": "No URL provided"}), 400
-        
-    # 1. Processing Lock (Simple demo guard)
-    if not Guardrail.acquire_processing_lock():
-        return jsonify({"error": "Server busy roasting another victim. Please wait 10 seconds."}), 503
+    try:
+        # Before any git call: the URL ends up on ls-remote / fetch / clone command lines
+        validate_repo_url(repo_url)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
         
+    force_refresh = bool(data.get('force_refresh', False))
+
+    # Cache hits never touch the scheduler: resolve HEAD remotely and answer right away
+    if not force_refresh:
+        cached_hash = lookup_cached_roast(repo_url)
+        if cached_hash:
+            print("Cache hit! Serving pre-roasted content.")
+            metrics.inc('reporoast_cache_hits_total', layer='preflight')
+            metrics.flush()
+            return jsonify({"status": "ready", "redirect_url": url_for('main.result', repo_hash=cached_hash)})
+
+    # Queue the pipeline and answer immediately; the browser polls /api/jobs/<id>
     try:
-        # 2. Ingest
-        print(f"Ingesting {repo_url}...")
-        try:
-            repo_structure = ingest_repo(repo_url)
-        except Exception as e:
-            return jsonify({"error": f"Failed to ingest repo: {str(e)}"}), 400
+        job = job_manager.submit(repo_url, force_refresh=force_refresh)
+    except SchedulerBusy as busy:
+        metrics.inc('reporoast_rejections_total')
+        metrics.flush()
+        response = jsonify({
+            "error": "Server busy roasting other victims. Please try again shortly.",
+            "queue_depth": busy.queue_depth,
+            "eta_seconds": busy.eta_seconds
+        })
+        response.headers['Retry-After'] = str(max(1, busy.eta_seconds))
+        return response, 503
 
-        # 3. Hash & Cache Check
-        repo_meta = repo_structure.get('meta', {})
-        repo_hash = get_repo_hash(repo_url, repo_meta.get('commit_hash', 'unknown'))
-        
-        # Save full repo data for code viewer ASAP
-        save_repo_data(repo_hash, repo_structure)
-
-        # CACHING DISABLED: Always generate fresh analysis
-        # cached_analysis = get_cached_result(repo_hash)
-        # if cached_analysis:
-        #     print("Cache hit! Serving pre-roasted content.")
-        #     return jsonify({"status": "ready", "redirect_url": url_for('main.result', repo_hash=repo_hash)})
-
-        # 4. Classify & Prune
-        print("Classifying and pruning...")
-        classify_file(repo_structure)
-        blueprint = estimate_and_prune(repo_structure)
-        
-        # 5. AI Analysis
-        print("Calling Gemini...")
-        analysis = ai_service.analyze_repo(blueprint)
-        if "error" in analysis:
-             return jsonify(analysis), 500
-             
-        # 6. Audio Generation
-        print("Synthesizing audio...")
-        audio_path = tts_service.generate_roast_audio(analysis.get('roast_dialogue', []), repo_hash)
-        analysis['audio_path'] = audio_path
-        
-        # 7. Save Result
-        save_result(repo_hash, analysis)
-        
-        return jsonify({"status": "ready", "redirect_url": url_for('main.result', repo_hash=repo_hash)})
+    state = job_manager.get(job.id)
+    return jsonify({
+        "status": "queued",
+        "job_id": job.id,
+        "position": state.get('position', 0),
+        "eta_seconds": state.get('eta_seconds', 0),
+        "status_url": url_for('main.job_status', job_id=job.id),
+        "events_url": url_for('main.job_events', job_id=job.id)
+    }), 202
+
+def _job_payload(state, since=0):
+    payload = {k: v for k, v in state.items() if k != 'events'}
+    payload['events'] = state['events'][since:]
+    if state['status'] == 'done':
+        payload['redirect_url'] = url_for('main.result', repo_hash=state['repo_hash'])
+    return payload
+
+@bp.route('/api/jobs/<job_id>')
+def job_status(job_id):
+    """Job state plus events after ?since=N (so pollers only get what is new)."""
+    state = job_manager.get(job_id)
+    if not state:
+        return jsonify({"error": "Job not found"}), 404
+    since = request.args.get('since', 0, type=int)
+    return jsonify(_job_payload(state, since))
+
+@bp.route('/api/jobs/<job_id>/events')
+def job_events(job_id):
+    """Server-sent events: one `progress` event per stage, then `done` or `error`."""
+    if not job_manager.get(job_id):
+        return jsonify({"error": "Job not found"}), 404
 
-    except Exception as e:
-        print(f"Critical error: {e}")
-        return jsonify({"error": str(e)}), 500
-    finally:
-        Guardrail.release_processing_lock()
+    # url_for needs the request context, which is gone once the generator runs
+    result_url_template = url_for('main.result', repo_hash='__HASH__')
+
+    def stream():
+        since = 0
+        deadline = time.time() + SSE_MAX_SECONDS
+        while time.time() < deadline:
+            state = job_manager.wait_for_events(job_id, since, SSE_HEARTBEAT_SECONDS)
+            if state is None:
+                return
+            new_events = state['events'][since:]
+            since += len(new_events)
+            for event in new_events:
+                yield f"event: progress\ndata: {json.dumps(event)}\n\n"
+            if state['status'] == 'done':
+                done = {"repo_hash": state['repo_hash'],
+                        "redirect_url": result_url_template.replace('__HASH__', state['repo_hash'])}
+                yield f"event: done\ndata: {json.dumps(done)}\n\n"
+                return
+            if state['status'] == 'error':
+                yield f"event: error\ndata: {json.dumps({'error': state['error']})}\n\n"
+                return
+            if not new_events:
+                yield ": keep-alive\n\n"
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @bp.route('/result/<repo_hash>')
 def result(repo_hash):
     analysis = get_cached_result(repo_hash)
     if not analysis:
         return redirect(url_for('main.index'))
+    record_access(repo_hash)
     
     # Get Repo Name from Metadata
     repo_data = get_repo_data(repo_hash)
@@ -117,33 +172,104 @@ def result(repo_hash):
 
 # --- Code Viewer API ---
 
+# A file's content under a repo hash is fixed by the commit, so it can be cached forever
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+IMMUTABLE_CACHE_CONTROL = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"  # Cacheable, but checked with the ETag on every use
+COMPRESS_MIN_BYTES = 1024
+
+def _negotiate_encoding():
+    """Best supported Content-Encoding for this request: 'br', 'gzip' or None."""
+    if brotli is not None and request.accept_encodings['br']:
+        return 'br'
+    if request.accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+def _viewer_etag(*parts):
+    """Strong ETag from the identity of a response (repo hash + path, or a file validator), per encoding."""
+    encoding = _negotiate_encoding()
+    digest = hashlib.sha256('::'.join(parts).encode()).hexdigest()[:32]
+    return f"{digest}-{encoding}" if encoding else digest, encoding
+
+def _cache_headers(response, etag, cache_control):
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    response.vary.add('Accept-Encoding')
+    return response
+
+def _not_modified(etag, cache_control=IMMUTABLE_CACHE_CONTROL):
+    if request.if_none_match.contains(etag):
+        return _cache_headers(Response(status=304), etag, cache_control)
+    return None
+
+def _viewer_json(payload, etag, encoding, cache_control=IMMUTABLE_CACHE_CONTROL):
+    """JSON response with an ETag; bodies above COMPRESS_MIN_BYTES are compressed once and reused."""
+    body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    response = Response(mimetype='application/json')
+    if encoding and len(body) >= COMPRESS_MIN_BYTES:
+        key = ('http', etag)
+        compressed = memory_cache.get(key)
+        if compressed is None:
+            compressed = brotli.compress(body, quality=5) if encoding == 'br' else gzip.compress(body, compresslevel=6)
+            memory_cache.put(key, compressed, len(compressed))
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+    else:
+        response.set_data(body)
+    return _cache_headers(response, etag, cache_control)
+
 @bp.route('/api/repo/<repo_hash>/files')
 def get_repo_files(repo_hash):
-    repo_data = get_repo_data(repo_hash)
-    if not repo_data:
+    # The listing of a hash changes when its snapshot is rewritten (force refresh, a
+    # different ingest deadline or limits), so it is revalidated against the snapshot file
+    validator = snapshot_validator(repo_hash)
+    if validator is None:
+        return jsonify({"error": "Repo not found"}), 404
+    record_access(repo_hash)
+    etag, encoding = _viewer_etag(repo_hash, 'files', *map(str, validator))
+    not_modified = _not_modified(etag, REVALIDATE_CACHE_CONTROL)
+    if not_modified:
+        return not_modified
+
+    # Return list of file paths for the tree view (read from the path index)
+    files = list_repo_paths(repo_hash)
+    if files is None:
         return jsonify({"error": "Repo not found"}), 404
         
-    # Return list of file paths for the tree view
-    files = [f['path'] for f in repo_data['files']]
-    return jsonify({"files": sorted(files)})
+    return _viewer_json({"files": files}, etag, encoding, REVALIDATE_CACHE_CONTROL)
 
 @bp.route('/api/repo/<repo_hash>/file')
 def get_file_content(repo_hash):
     path = request.args.get('path')
-    repo_data = get_repo_data(repo_hash)
-    if not repo_data:
+    if not path:
+        return jsonify({"error": "No path provided"}), 400
+    if not has_repo_data(repo_hash):
         return jsonify({"error": "Repo not found"}), 404
+    record_access(repo_hash)
+
+    etag, encoding = _viewer_etag(repo_hash, 'file', path)
+    not_modified = _not_modified(etag)
+    if not_modified:
+        return not_modified
         
-    file_obj = next((f for f in repo_data['files'] if f['path'] == path), None)
+    file_obj = get_repo_file(repo_hash, path)
     if not file_obj:
          return jsonify({"error": "File not found"}), 404
          
-    return jsonify({
+    return _viewer_json({
         "path": file_obj['path'],
         "content": file_obj.get('content', ''),
         "language": file_obj.get('language', 'text')
-    })
+    }, etag, encoding)
     
 @bp.route('/generated/<path:filename>')
 def serve_generated(filename):
-    return send_from_directory('static/generated', filename)
+    # Audio names include a digest of the dialogue, so a given URL never changes content.
+    # send_from_directory already answers conditional (304) and Range requests for seeking.
+    if '/' not in filename and filename.startswith('roast_'):
+        # Made by another instance: pull it from the shared store (no-op without one)
+        ensure_local(os.path.join(GENERATED_DIR, filename), generated_key(filename))
+    response = send_from_directory(GENERATED_DIR, filename, max_age=IMMUTABLE_MAX_AGE)
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
@@ -1,116 +1,257 @@
 
 import re
+import hashlib
 
 def generate_tree(files):
     """
     Generates a tree-like string representation of the repository structure.
     """
-    tree_str = "Repository Structure:\n"
     sorted_paths = sorted([f['path'] for f in files])
     
     # Simple list approach for now, a full tree ASCII art is nice but complex to get perfect
     # Let's do an indented list which is token-efficient and clear
-    for path in sorted_paths:
-        tree_str += f"- {path}\n"
-        
-    return tree_str
+    if not sorted_paths:
+        return "Repository Structure:\n"
+    return "Repository Structure:\n- " + "\n- ".join(sorted_paths) + "\n"
 
-def extract_interface(content, language):
+# Single-pass line scanners per language: one MULTILINE regex, each alternative anchored
+# at a line start and unable to cross a newline, so every match is one kept line
+_SCANNER_PATTERNS = {
+    'Python': [
+        r'(?:import|from)[ \t]',
+        r'[ \t]*class[ \t]+\w+',
+        r'[ \t]*(?:async[ \t]+)?def[ \t]+\w+',  # Methods too, not just top-level functions
+        r'[ \t]*@\w'
+    ],
+    'JavaScript': [
+        r'(?:import|export)[ \t]',
+        r'(?:const|let|var)[ \t]+\w+[ \t]*=[ \t]*require\(',
+        r'class[ \t]+\w+',
+        r'(?:async[ \t]+)?function[ \t]*\*?[ \t]*\w+',
+        r'(?:const|let|var)[ \t]+\w+[ \t]*=[ \t]*(?:async[ \t]*)?\(',  # Arrow functions (rough)
+        r'[ \t]*(?!(?:if|for|while|switch|catch|return)\b)\w+[ \t]*\([^)\n]*\)[ \t]*\{'  # Method signatures
+    ],
+    'TypeScript': [
+        r'(?:import|export)[ \t]',
+        r'(?:abstract[ \t]+)?class[ \t]+\w+',
+        r'interface[ \t]+\w+',
+        r'type[ \t]+\w+',
+        r'enum[ \t]+\w+',
+        r'(?:async[ \t]+)?function[ \t]*\*?[ \t]*\w+',
+        r'(?:const|let|var)[ \t]+\w+[ \t]*=[ \t]*(?:async[ \t]*)?\('
+    ],
+    'Java': [
+        r'package[ \t]',
+        r'import[ \t]',
+        r'[ \t]*public[ \t]+(?:(?:abstract|final|static|sealed)[ \t]+)*(?:class|interface|enum|record)[ \t]',
+        r'[ \t]*public[ \t]+(?:(?:abstract|final|static|synchronized)[ \t]+)*[\w<>\[\],?]+[ \t]+\w+[ \t]*\('  # public methods
+    ],
+    'Go': [
+        r'package[ \t]',
+        r'import[ \t]',
+        r'func[ \t]',
+        r'type[ \t]+\w+'
+    ],
+    'Rust': [
+        r'(?:pub(?:\([^)\n]*\))?[ \t]+)?use[ \t]',
+        r'(?:pub(?:\([^)\n]*\))?[ \t]+)?(?:struct|enum|trait|type|mod|union)[ \t]+\w+',
+        r'(?:unsafe[ \t]+)?impl\b',
+        r'[ \t]*(?:pub(?:\([^)\n]*\))?[ \t]+)?(?:const[ \t]+)?(?:async[ \t]+)?(?:unsafe[ \t]+)?(?:extern[ \t]+"[^"\n]*"[ \t]+)?fn[ \t]+\w+'
+    ],
+    'C': [
+        r'#[ \t]*(?:include|define)\b',
+        r'(?:typedef[ \t]+)?(?:struct|union|enum)[ \t]+\w+',
+        # Function definitions/prototypes start at column 0
+        r'(?!(?:if|for|while|switch|return|else|do)\b)[A-Za-z_][\w \t\*]*[ \t\*]\w+[ \t]*\([^;{\n]*\)[ \t]*;?[ \t]*\{?[ \t]*$'
+    ],
+    'C++': [
+        r'#[ \t]*(?:include|define)\b',
+        r'(?:template[ \t]*<|namespace\b|using[ \t])',
+        r'(?:typedef[ \t]+)?(?:class|struct|union|enum(?:[ \t]+class)?)[ \t]+\w+',
+        r'[ \t]*(?:public|protected|private)[ \t]*:',
+        r'(?!(?:if|for|while|switch|return|else|do)\b)[A-Za-z_~][\w \t\*&:<>,]*[ \t\*&:~]\w+[ \t]*\([^;{\n]*\)[ \t]*(?:const[ \t]*)?(?:override[ \t]*)?;?[ \t]*\{?[ \t]*$'
+    ],
+    'C#': [
+        r'using[ \t]',
+        r'namespace[ \t]',
+        r'[ \t]*(?:(?:public|internal|protected|private|static|abstract|sealed|partial)[ \t]+)*(?:class|interface|struct|enum|record)[ \t]+\w+',
+        r'[ \t]*(?:public|protected|internal)[ \t]+(?:[\w<>\[\],?]+[ \t]+)+\w+[ \t]*\('
+    ],
+    'Ruby': [
+        r'require(?:_relative)?[ \t]',
+        r'[ \t]*(?:class|module)[ \t]+\w+',
+        r'[ \t]*def[ \t]+',
+        r'[ \t]*attr_(?:reader|writer|accessor)\b'
+    ],
+    'PHP': [
+        r'namespace[ \t]',
+        r'use[ \t]',
+        r'[ \t]*(?:(?:abstract|final)[ \t]+)?(?:class|interface|trait|enum)[ \t]+\w+',
+        r'[ \t]*(?:(?:public|protected|private|static|abstract|final)[ \t]+)*function[ \t]+\w+'
+    ],
+    'Shell': [
+        r'(?:function[ \t]+)?[\w-]+[ \t]*\(\)[ \t]*\{?',
+        r'function[ \t]+[\w-]+',
+        r'(?:source|\.)[ \t]'
+    ]
+}
+_SCANNERS = {
+    language: re.compile(r'^(?:' + '|'.join(f'(?:{p})' for p in patterns) + r').*', re.MULTILINE)
+    for language, patterns in _SCANNER_PATTERNS.items()
+}
+
+def _scan_interface(content, scanner):
+    return [match.group(0) for match in scanner.finditer(content) if match.group(0).strip()]
+
+def extract_interface(content, language, digest=None):
     """
     Extracts high-level structure (imports, classes, functions) from code based on language.
-    Returns a string summary.
+    Returns a string summary. Memoized by content hash, so the same file content
+    (repeated across files, repos or re-roasts in this process) is scanned once.
+    `digest` is the content's hash if the caller has it (a file record's blob id).
     """
-    lines = content.splitlines()
-    summary = []
-    
-    # Regex patterns for different languages
-    patterns = {
-        'Python': [
-            r'^(import|from)\s+', 
-            r'^class\s+\w+', 
-            r'^def\s+\w+', 
-            r'^@'
-        ],
-        'JavaScript': [
-            r'^(import|export)\s+', 
-            r'^(const|let|var)\s+\w+\s*=\s*require\(', 
-            r'^class\s+\w+', 
-            r'^function\s+\w+', 
-            r'^(const|ket|var)\s+\w+\s*=\s*\(', # Arrow functions (rough)
-            r'^\s*\w+\s*\([^)]*\)\s*{' # Method signatures
-        ],
-        'TypeScript': [
-             r'^(import|export)\s+', 
-             r'^class\s+\w+', 
-             r'^interface\s+\w+', 
-             r'^type\s+\w+', 
-             r'^function\s+\w+'
-        ],
-        'Java': [
-            r'^package\s+', 
-            r'^import\s+', 
-            r'^\s*public\s+(class|interface|enum)\s+', 
-            r'^\s*public\s+\w+\s+\w+\(' # public methods
-        ],
-        'Go': [
-            r'^package\s+', 
-            r'^import\s+', 
-            r'^func\s+'
-        ]
-    }
-    
-    lang_patterns = patterns.get(language, [])
-    if not lang_patterns:
+    from app.services.guardrail_service import memory_cache  # Import cycle: guardrail imports this module
+
+    key = ('interface', language, digest or hashlib.sha1(content.encode('utf-8', 'surrogatepass')).hexdigest())
+    summary = memory_cache.get(key)
+    if summary is None:
+        summary = _extract_interface(content, language)
+        memory_cache.put(key, summary, len(summary))
+    return summary
+
+def _extract_interface(content, language):
+    scanner = _SCANNERS.get(language)
+    if scanner is None:
         # Fallback: First 20 lines
-        return "\n".join(lines[:20]) + "\n... (content omitted)"
-        
-    for line in lines:
-        line_strip = line.strip()
-        # Keep empty lines for readability? Maybe compact it.
-        if not line_strip:
-            continue
-            
-        # Check against patterns
-        # We use the original line to preserve indentation for Python/YAML
-        if any(re.search(p, line) for p in lang_patterns):
-            summary.append(line)
-            
+        return "\n".join(content.splitlines()[:20]) + "\n... (content omitted)"
+
+    summary = _scan_interface(content, scanner)
     summary.append(f"... (Implementation details omitted for {language} file)")
     return "\n".join(summary)
 
+BLUEPRINT_HEADER = "=== REPOSITORY BLUEPRINT ===\n\n"
+TREE_FOOTER = "\n" + "="*30 + "\n\n"
+FILE_FOOTER = "\n=== END FILE ===\n\n"
+
+def _file_header(file, category):
+    header = f"=== FILE: {file['path']} ({file.get('language', 'Unknown')}) ===\nCategory: {category}\n"
+    if file.get('duplicates'):
+        # Near-copies collapsed into this file by dedup_service
+        header += f"Duplicated at: {', '.join(file['duplicates'])}\n"
+    return header
+
+def _file_body(file, category):
+    if category == 'FULL_CODE':
+        return file.get('content', '')
+    if 'interface' in file:
+        # INTERFACE_ONLY, summarized at ingest time (content not kept in memory)
+        return file['interface']
+    # INTERFACE_ONLY
+    return extract_interface(file.get('content', ''), file.get('language', 'Unknown'), file.get('blob'))
+
 def generate_blueprint(repo_structure):
     """
     Generates the single prompt context string.
     """
+    # Chunks are collected and joined once: repeated += on a multi-megabyte string
+    # is only cheap while CPython can resize it in place, otherwise it copies every time
+    return "".join(blueprint_chunks(repo_structure))
+
+def blueprint_chunks(repo_structure):
+    """
+    The blueprint as a list of chunks (headers, file bodies, footers), for callers
+    that can write or send them without building the whole string.
+    """
     files = repo_structure['files']
+    chunks = []
+    append = chunks.append
     
     # 1. Tree Structure
-    blueprint = "=== REPOSITORY BLUEPRINT ===\n\n"
-    blueprint += generate_tree(files)
-    blueprint += "\n" + "="*30 + "\n\n"
+    append(BLUEPRINT_HEADER)
+    append(generate_tree(files))
+    append(TREE_FOOTER)
     
     # 2. File Contents
     for file in files:
         category = file.get('category', 'INTERFACE_ONLY') # Default to interface
-        path = file['path']
-        language = file.get('language', 'Unknown')
-        content = file.get('content', '')
-        
         if category == 'IGNORE':
             continue
-            
-        blueprint += f"=== FILE: {path} ({language}) ===\n"
-        blueprint += f"Category: {category}\n"
-        
+        append(_file_header(file, category))
+        append(_file_body(file, category))
+        append(FILE_FOOTER)
+    return chunks
+
+def _char_size(text, language=None, digest=None):
+    return len(text)
+
+def build_blueprint(repo_structure, limit, measure=_char_size):
+    """
+    Generates the blueprint within `limit`, in units of measure(text, language, digest) (chars
+    by default, e.g. token_service.estimate_tokens for tokens). Past the limit, FULL_CODE
+    files are downgraded to INTERFACE_ONLY, then INTERFACE_ONLY files to IGNORE (path
+    listed in the tree only), least important first: lowest file['importance']
+    (graph_service centrality, 1.0 if unranked) per unit saved, so with equal
+    importance the biggest files go first. Section sizes are computed once per file and
+    the string is rendered once at the end, most important files first.
+    Downgraded files get their `interface` set and category changed in place.
+    Returns (blueprint, downgraded_count, dropped_count, estimated_size).
+    """
+    files = repo_structure['files']
+    footer_size = measure(FILE_FOOTER)
+    total = measure(BLUEPRINT_HEADER) + measure(generate_tree(files)) + measure(TREE_FOOTER)
+    full_code = []
+    interface_sizes = {}  # id(file) -> size of its INTERFACE_ONLY section
+    for file in files:
+        category = file.get('category', 'INTERFACE_ONLY')
+        if category == 'IGNORE':
+            continue
+        language = file.get('language', 'Unknown')
         if category == 'FULL_CODE':
-            blueprint += content
+            full_size = measure(_file_header(file, category)) + measure(file.get('content', ''), language, file.get('blob'))
+            full_code.append((file, full_size))
+            total += full_size + footer_size
         else:
-            # INTERFACE_ONLY
-            blueprint += extract_interface(content, language)
-            
-        blueprint += "\n=== END FILE ===\n\n"
-        
-    return blueprint
+            if 'interface' not in file:
+                file['interface'] = _file_body(file, category)
+            size = measure(_file_header(file, category)) + measure(file['interface'], language) + footer_size
+            interface_sizes[id(file)] = (file, size)
+            total += size
+
+    downgraded = 0
+    if total > limit:
+        candidates = []
+        for file, full_size in full_code:
+            language = file.get('language', 'Unknown')
+            interface = extract_interface(file.get('content', ''), language, file.get('blob'))
+            interface_size = measure(_file_header(file, 'INTERFACE_ONLY')) + measure(interface, language)
+            saving = full_size - interface_size
+            if saving > 0:
+                candidates.append((file.get('importance', 1.0) / saving, saving, file, interface, interface_size))
+            interface_sizes[id(file)] = (file, interface_size + footer_size)
+        candidates.sort(key=lambda item: item[0])
+        for _, saving, file, interface, _ in candidates:
+            if total <= limit:
+                break
+            file['category'] = 'INTERFACE_ONLY'
+            file['interface'] = interface
+            total -= saving
+            downgraded += 1
+
+    dropped = 0
+    if total > limit:
+        # Every FULL_CODE file worth downgrading is an interface now; drop the least important ones
+        candidates = [(file.get('importance', 1.0) / size, size, file)
+                      for file, size in interface_sizes.values() if file.get('category') == 'INTERFACE_ONLY']
+        candidates.sort(key=lambda item: item[0])
+        for _, size, file in candidates:
+            if total <= limit:
+                break
+            file['category'] = 'IGNORE'
+            total -= size
+            dropped += 1
+
+    ranked = {'files': sorted(files, key=lambda f: -f.get('importance', 1.0))}  # Stable: ingest order on ties
+    return generate_blueprint(ranked), downgraded, dropped, total
 
 if __name__ == "__main__":
     # Mock data validation
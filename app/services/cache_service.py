@@ -0,0 +1,338 @@
+import os
+import sys
+import time
+import threading
+import argparse
+from app.services.guardrail_service import (
+    CACHE_DIR, BLOB_DIR, QUARANTINE_DIR, memory_cache, process_lock, remove_lock_file, _blob_path, _entry_lock
+)
+from app.services.job_service import JOBS_DIR
+from app.services.serializer_service import CacheFormatError, cache_serializer
+from app.services.tts_service import GENERATED_DIR
+
+# Last access per repo hash, kept as the mtime of app/cache/access/<hash> (file mtimes
+# can't be used: result freshness and the memory cache validators depend on them)
+ACCESS_DIR = os.path.join(CACHE_DIR, 'access')
+ACCESS_TOUCH_SECONDS = 300  # At most one touch per hash per worker in this window
+# Blobs not referenced by any snapshot are kept this long (an ingestion may still be writing its manifest)
+BLOB_GRACE_SECONDS = 3600
+QUARANTINE_MAX_AGE_SECONDS = 7 * 24 * 3600
+# Job state files not updated this long belong to jobs whose worker is gone (the owner
+# forgets finished jobs itself after job_service.JOB_RETENTION_SECONDS)
+JOB_FILE_MAX_AGE_SECONDS = 24 * 3600
+SWEEP_INTERVAL_SECONDS = int(os.getenv('ROAST_CACHE_SWEEP_INTERVAL_SECONDS', '600'))
+
+def _limit(name, default):
+    return int(os.getenv(name, str(default)))
+
+# Per artifact class: total bytes and age since last access (0 = unlimited)
+#   results:   <hash>.json plus its roast_<hash>_*.mp3 (evicted together, a result page needs its audio)
+#   audio:     roast_<hash>_*.mp3 (same unit as results, budgeted separately)
+#   snapshots: <hash>_repo.json + .idx, plus the blobs only they reference
+CACHE_LIMITS = {
+    'results': (_limit('ROAST_RESULTS_MAX_BYTES', 256 * 1024 ** 2), _limit('ROAST_RESULTS_MAX_AGE_SECONDS', 30 * 24 * 3600)),
+    'audio': (_limit('ROAST_AUDIO_MAX_BYTES', 1024 ** 3), _limit('ROAST_AUDIO_MAX_AGE_SECONDS', 30 * 24 * 3600)),
+    'snapshots': (_limit('ROAST_SNAPSHOTS_MAX_BYTES', 2 * 1024 ** 3), _limit('ROAST_SNAPSHOTS_MAX_AGE_SECONDS', 30 * 24 * 3600)),
+}
+
+_recent_access = {}
+_recent_access_lock = threading.Lock()
+
+def record_access(repo_hash):
+    """Marks repo_hash as used (LRU). Cheap enough to call on every cache hit."""
+    if not repo_hash.isalnum():
+        return
+    now = time.time()
+    with _recent_access_lock:
+        if now - _recent_access.get(repo_hash, 0) < ACCESS_TOUCH_SECONDS:
+            return
+        _recent_access[repo_hash] = now
+    try:
+        os.makedirs(ACCESS_DIR, exist_ok=True)
+        path = os.path.join(ACCESS_DIR, repo_hash)
+        with open(path, 'a'):
+            pass
+        os.utime(path, (now, now))
+    except OSError as e:
+        print(f"Failed to record cache access for {repo_hash}: {e}")
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0
+
+def _last_access(repo_hash, paths):
+    """Access stamp, or the newest artifact mtime for entries never read since they were written."""
+    return max([_mtime(os.path.join(ACCESS_DIR, repo_hash))] + [_mtime(p) for p in paths])
+
+class CacheEntry:
+    """Everything one artifact class stores for one repo hash."""
+    def __init__(self, repo_hash):
+        self.repo_hash = repo_hash
+        self.paths = []
+        self.size = 0
+        self.blobs = []  # Snapshots only: blob ids referenced by the manifest
+        self.readable = True  # Snapshots only: False if the manifest's format can't be decoded here
+        self.last_access = 0
+
+    def add(self, path):
+        self.paths.append(path)
+        self.size += _size(path)
+
+def _audio_hash(name):
+    # roast_<unique_id>_<dialogue digest>.mp3
+    return name[len('roast_'):-len('.mp3')].rsplit('_', 1)[0]
+
+def scan_cache():
+    """
+    Returns ({class: {repo_hash: CacheEntry}}, {blob_id: size}) for everything on disk.
+    Reads every snapshot manifest (for blob references), so it is meant for the sweeper and CLI.
+    """
+    classes = {'results': {}, 'audio': {}, 'snapshots': {}}
+
+    def entry(cls, repo_hash):
+        return classes[cls].setdefault(repo_hash, CacheEntry(repo_hash))
+
+    if os.path.isdir(CACHE_DIR):
+        for name in os.listdir(CACHE_DIR):
+            path = os.path.join(CACHE_DIR, name)
+            if name.endswith('_repo.json') or name.endswith('_repo.idx'):
+                entry('snapshots', name.rsplit('_repo.', 1)[0]).add(path)
+            elif name.endswith('.json') and name[:-len('.json')].isalnum():
+                entry('results', name[:-len('.json')]).add(path)
+    if os.path.isdir(GENERATED_DIR):
+        for name in os.listdir(GENERATED_DIR):
+            if name.startswith('roast_') and name.endswith('.mp3'):
+                entry('audio', _audio_hash(name)).add(os.path.join(GENERATED_DIR, name))
+
+    for snapshot in classes['snapshots'].values():
+        manifest = os.path.join(CACHE_DIR, f"{snapshot.repo_hash}_repo.json")
+        try:
+            data, _ = cache_serializer.load_file(manifest)
+            snapshot.blobs = [f['blob'] for f in data.get('files', []) if f.get('blob')]
+        except CacheFormatError:
+            snapshot.readable = False
+        except Exception:
+            pass  # Missing/corrupt manifests are the cache checker's business
+
+    blobs = {}
+    if os.path.isdir(BLOB_DIR):
+        for prefix in os.listdir(BLOB_DIR):
+            directory = os.path.join(BLOB_DIR, prefix)
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                if not name.endswith('.tmp'):
+                    blobs[prefix + name] = _size(os.path.join(directory, name))
+
+    for entries in classes.values():
+        for item in entries.values():
+            item.last_access = _last_access(item.repo_hash, item.paths)
+    return classes, blobs
+
+def _remove(paths):
+    freed = 0
+    for path in paths:
+        size = _size(path)
+        try:
+            os.remove(path)
+            freed += size
+        except FileNotFoundError:
+            pass
+        for kind in ('result', 'snapshot', 'index'):
+            memory_cache.invalidate((kind, path))
+    return freed
+
+def _evict(repo_hash, paths):
+    """
+    Deletes one repo hash's files unless a roast of it is in flight (single-flight
+    lock) or a writer holds its cache lock. Returns bytes freed, or None if skipped.
+    """
+    with process_lock(repo_hash, blocking=False) as idle:
+        if not idle:
+            return None
+        with process_lock(_entry_lock(repo_hash), blocking=False) as acquired:
+            if not acquired:
+                return None
+            freed = _remove(paths)
+            # Recreated on the next roast of this hash; waiters move over to the new file
+            remove_lock_file(_entry_lock(repo_hash))
+            remove_lock_file(repo_hash)
+            return freed
+
+def prune(dry_run=False, now=None):
+    """
+    Evicts by age, then least recently accessed first, until every class fits its
+    limits in CACHE_LIMITS; then deletes unreferenced blobs and old quarantine and job files.
+    Returns a report: {class: {'evicted', 'freed_bytes', 'remaining_bytes'}}.
+    """
+    now = now or time.time()
+    classes, blobs = scan_cache()
+    report = {}
+
+    refcount = {}
+    for snapshot in classes['snapshots'].values():
+        for blob_id in set(snapshot.blobs):
+            refcount[blob_id] = refcount.get(blob_id, 0) + 1
+
+    def snapshot_size(snapshot):
+        # Manifest + index + blobs no other snapshot shares
+        return snapshot.size + sum(blobs.get(b, 0) for b in set(snapshot.blobs) if refcount.get(b) == 1)
+
+    for cls in ('results', 'audio', 'snapshots'):
+        max_bytes, max_age = CACHE_LIMITS[cls]
+        entries = sorted(classes[cls].values(), key=lambda item: item.last_access)
+        sizes = {item.repo_hash: snapshot_size(item) if cls == 'snapshots' else item.size for item in entries}
+        total = sum(sizes.values())
+        evicted, freed = 0, 0
+        for item in entries:
+            expired = max_age > 0 and now - item.last_access > max_age
+            over = max_bytes > 0 and total > max_bytes
+            if not expired and not over:
+                break  # Sorted by access: nothing after this is older
+            paths = list(item.paths)
+            partner = None
+            if cls in ('results', 'audio'):
+                # A result page without its audio (or audio without a page) is useless
+                partner = 'audio' if cls == 'results' else 'results'
+                paths += classes[partner][item.repo_hash].paths if item.repo_hash in classes[partner] else []
+            if not dry_run and _evict(item.repo_hash, paths) is None:
+                continue
+            if partner:
+                classes[partner].pop(item.repo_hash, None)
+            total -= sizes[item.repo_hash]
+            evicted += 1
+            freed += sizes[item.repo_hash]
+            if cls == 'snapshots':
+                for blob_id in set(item.blobs):
+                    refcount[blob_id] -= 1
+        report[cls] = {'evicted': evicted, 'freed_bytes': freed, 'remaining_bytes': total}
+
+    # Blobs: mark (refcount) and sweep, with a grace period for ingestions in progress.
+    # A manifest this process can't decode may reference any blob: no sweep then.
+    evicted, freed = 0, 0
+    sweep = all(snapshot.readable for snapshot in classes['snapshots'].values())
+    for blob_id, size in blobs.items():
+        if not sweep or refcount.get(blob_id, 0) > 0:
+            continue
+        path = _blob_path(blob_id)
+        if now - _mtime(path) < BLOB_GRACE_SECONDS:
+            continue
+        if not dry_run:
+            _remove([path])
+            memory_cache.invalidate(('blob', blob_id))
+        evicted += 1
+        freed += size
+    report['blobs'] = {'evicted': evicted, 'freed_bytes': freed,
+                       'remaining_bytes': sum(blobs.values()) - freed}
+
+    if not dry_run:
+        _prune_quarantine(now)
+        _prune_access_stamps(classes)
+        _prune_job_files(now)
+    return report
+
+def _prune_quarantine(now):
+    if not os.path.isdir(QUARANTINE_DIR):
+        return
+    for name in os.listdir(QUARANTINE_DIR):
+        path = os.path.join(QUARANTINE_DIR, name)
+        if now - _mtime(path) > QUARANTINE_MAX_AGE_SECONDS:
+            _remove([path])
+
+def _prune_job_files(now):
+    if not os.path.isdir(JOBS_DIR):
+        return
+    for name in os.listdir(JOBS_DIR):
+        path = os.path.join(JOBS_DIR, name)
+        if now - _mtime(path) > JOB_FILE_MAX_AGE_SECONDS:
+            _remove([path])
+
+def _prune_access_stamps(classes):
+    # Stamps of hashes with no artifacts left
+    if not os.path.isdir(ACCESS_DIR):
+        return
+    for repo_hash in os.listdir(ACCESS_DIR):
+        paths = [p for entries in classes.values() if repo_hash in entries for p in entries[repo_hash].paths]
+        if not any(os.path.exists(p) for p in paths):
+            _remove([os.path.join(ACCESS_DIR, repo_hash)])
+
+def usage_report():
+    """{class: {'entries', 'bytes', 'max_bytes', 'max_age_seconds', 'oldest_access'}} plus blobs."""
+    classes, blobs = scan_cache()
+    report = {}
+    for cls, entries in classes.items():
+        max_bytes, max_age = CACHE_LIMITS[cls]
+        report[cls] = {
+            'entries': len(entries),
+            'bytes': sum(item.size for item in entries.values()),
+            'max_bytes': max_bytes,
+            'max_age_seconds': max_age,
+            'oldest_access': min((item.last_access for item in entries.values()), default=None)
+        }
+    report['blobs'] = {'entries': len(blobs), 'bytes': sum(blobs.values())}
+    return report
+
+class CacheSweeper:
+    """Background thread that runs prune() periodically; one worker at a time (non-blocking lock)."""
+    def __init__(self, interval):
+        self.interval = interval
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name='cache-sweeper', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                with process_lock('cache_sweeper', blocking=False) as acquired:
+                    if acquired:
+                        report = prune()
+                        if any(r['evicted'] for r in report.values()):
+                            print(f"Cache sweep: {report}")
+            except Exception as e:
+                print(f"Cache sweep failed: {e}")
+
+cache_sweeper = CacheSweeper(SWEEP_INTERVAL_SECONDS)
+
+def _format_bytes(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.1f} {unit}" if unit != 'B' else f"{size} B"
+        size /= 1024
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report and prune RepoRoast cache usage.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('report', help="Show usage per artifact class")
+    prune_parser = sub.add_parser('prune', help="Evict entries over their age/size limits")
+    prune_parser.add_argument('--dry-run', action='store_true', help="Only show what would be evicted")
+    args = parser.parse_args(argv)
+
+    if args.command == 'report':
+        for cls, info in usage_report().items():
+            limit = f" / {_format_bytes(info['max_bytes'])}" if info.get('max_bytes') else ''
+            print(f"{cls:<10} {info['entries']:>7} entries  {_format_bytes(info['bytes']):>10}{limit}")
+    else:
+        for cls, info in prune(dry_run=args.dry_run).items():
+            verb = 'would evict' if args.dry_run else 'evicted'
+            print(f"{cls:<10} {verb} {info['evicted']:>6}  freed {_format_bytes(info['freed_bytes']):>10}"
+                  f"  remaining {_format_bytes(info['remaining_bytes']):>10}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
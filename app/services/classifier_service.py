@@ -39,39 +39,63 @@ FULL_CODE_BOOST_PATTERNS = [
     r'Dockerfile', r'docker-compose'
 ]
 
-def classify_file(repo_structure):
-    """
-    Annotates each file in the repo structure with a category.
-    Mutates repo_structure in place.
-    """
-    files = repo_structure['files']
-    
+# Compiled once into a single alternation: one scan per path instead of ~30 re.search calls
+_IGNORE_RE = re.compile('|'.join(f'(?:{p})' for p in IGNORE_PATTERNS))
+
+def classify_path(path):
+    """Returns the FileCategory for a single repo-relative path."""
     # We now trust Gemini's massive context window. 
     # Strategy: 
     # 1. IGNORE irrelevant files (assets, locks, etc.)
     # 2. Everything else is FULL_CODE unless it's huge, then INTERFACE_ONLY.
+    path_lower = path.lower()
     
-    for file in files:
-        path = file['path']
-        path_lower = path.lower()
+    # Step 1: Check IGNORE
+    if _IGNORE_RE.search(path_lower):
+        return FileCategory.IGNORE
+    return _kept_category(path_lower)
+
+def _kept_category(path_lower):
+    """Category of a path that did not match IGNORE_PATTERNS."""
+    # Step 2: Check INTERFACE_ONLY (Explicit utility/config types that provide little roasted value)
+    # We can relax this too. Let's only downgrade if it matches specific low-value patterns.
+    # actually, for a good roast, we want to see the utils too.
+    # Let's only force INTERFACE_ONLY if it's a "definition" file or generated.
+    if path_lower.endswith('.d.ts') or path_lower.endswith('.min.js'):
+        return FileCategory.INTERFACE_ONLY
         
-        # Step 1: Check IGNORE
-        if any(re.search(p, path_lower) for p in IGNORE_PATTERNS):
-            file['category'] = FileCategory.IGNORE
-            continue
+    # Step 3: Default to FULL_CODE
+    # We rely on GuardrailService to prune if the TOTAL request gets too big.
+    # But here, we categorize as much as possible as FULL_CODE.
+    return FileCategory.FULL_CODE
 
-        # Step 2: Check INTERFACE_ONLY (Explicit utility/config types that provide little roasted value)
-        # We can relax this too. Let's only downgrade if it matches specific low-value patterns.
-        # actually, for a good roast, we want to see the utils too.
-        # Let's only force INTERFACE_ONLY if it's a "definition" file or generated.
-        if path_lower.endswith('.d.ts') or path_lower.endswith('.min.js'):
-            file['category'] = FileCategory.INTERFACE_ONLY
-            continue
-            
-        # Step 3: Default to FULL_CODE
-        # We rely on GuardrailService to prune if the TOTAL request gets too big.
-        # But here, we categorize as much as possible as FULL_CODE.
-        file['category'] = FileCategory.FULL_CODE
+def classify_paths(paths):
+    """
+    Batch classify_path: returns one FileCategory per path, in order.
+    (Scanning one newline-joined listing with a MULTILINE regex was measured
+    slower than this: mapping matches back to paths costs more than it saves.)
+    """
+    search = _IGNORE_RE.search
+    categories = []
+    append = categories.append
+    for path in paths:
+        path_lower = path.lower()
+        append(FileCategory.IGNORE if search(path_lower) else _kept_category(path_lower))
+    return categories
+
+def classify_record(file):
+    """Annotates a single file record (as yielded by the ingest stream) in place."""
+    file['category'] = classify_path(file['path'])
+    return file
+
+def classify_file(repo_structure):
+    """
+    Annotates each file in the repo structure with a category.
+    Mutates repo_structure in place.
+    """
+    files = repo_structure['files']
+    for file, category in zip(files, classify_paths([f['path'] for f in files])):
+        file['category'] = category
 
     return repo_structure
 
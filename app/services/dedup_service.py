@@ -0,0 +1,209 @@
+import os
+import re
+import zlib
+import hashlib
+from app.services.classifier_service import FileCategory
+from app.services.guardrail_service import memory_cache
+
+# Files at least this similar (estimated Jaccard over 5-word shingles) are collapsed into
+# one representative in the blueprint. 0 turns duplicate detection off.
+DUPLICATE_THRESHOLD = float(os.getenv('ROAST_DEDUP_THRESHOLD', '0.8'))
+
+# One-permutation MinHash: every shingle is hashed once and kept if it is the smallest
+# in its bucket, so a signature costs one crc32 per shingle instead of one per permutation.
+# Signatures are split into bands for LSH; files sharing any band are compared.
+SHINGLE_WORDS = 5
+SIGNATURE_BUCKETS = 64
+BAND_ROWS = 4
+MAX_PAIRWISE_BAND = 16
+MIN_SHINGLES = 100  # Smaller files are too short to tell copy-paste from shared boilerplate
+_EMPTY = 0xFFFFFFFF
+
+_WORDS = re.compile(r'\w+')
+
+# Generated code announces itself in the comment block it opens with, using one of the
+# markers generators actually write; minified bundles have enormous lines
+HEAD_CHARS = 2048
+_GENERATED_MARKER_RE = re.compile(
+    r'@generated\b|this file (?:was|is) automatically generated by|generated by the protocol buffer compiler',
+    re.IGNORECASE
+)
+_GO_GENERATED_RE = re.compile(r'^// Code generated .* DO NOT EDIT\.$', re.MULTILINE)  # golang.org/s/generatedcode
+_LINE_COMMENTS = ('#', '//', '--', ';')
+_BLOCK_COMMENTS = (('/*', '*/'), ('<!--', '-->'))
+# Prose: headings, bullets and long paragraph lines there aren't comments or minified code
+_PROSE_EXTENSIONS = {'.md', '.markdown', '.mdx', '.rst', '.txt', '.adoc'}
+MINIFIED_AVG_LINE_CHARS = 300
+# Third-party code checked into the repo: vendor dirs, or the /*! banner bundled JS/CSS
+# libraries put on top (with a version or license in it: C/C++ Doxygen and Qt file
+# headers also open with /*!)
+_VENDORED_PATH_RE = re.compile(r'(?:^|/)(?:vendor|vendors|third[_-]party|bower_components|pods)/')
+_VENDORED_HEAD_RE = re.compile(
+    r'\A\s*/\*![^\n]*(?:\bv?\d+\.\d+(?:\.\d+)?\b|licen[sc]e|copyright|\(c\))', re.IGNORECASE
+)
+_BANNER_EXTENSIONS = {'.js', '.mjs', '.cjs', '.css'}
+
+def redundancy_reason(file_record):
+    """'generated' or 'vendored' if the file isn't the repo's own hand-written code, else None."""
+    content = file_record.get('content', '')
+    head = content[:HEAD_CHARS]
+    path = file_record['path'].lower()
+    if _VENDORED_PATH_RE.search(path):
+        return 'vendored'
+    if os.path.splitext(path)[1] in _BANNER_EXTENSIONS and _VENDORED_HEAD_RE.search(head):
+        return 'vendored'
+    if os.path.splitext(path)[1] in _PROSE_EXTENSIONS:
+        return None
+    comments = _leading_comments(head)
+    if _GENERATED_MARKER_RE.search(comments) or _GO_GENERATED_RE.search(comments):
+        return 'generated'
+    lines = file_record.get('lines') or content.count('\n') + 1
+    if len(content) > HEAD_CHARS and len(content) / lines > MINIFIED_AVG_LINE_CHARS:
+        return 'generated'
+    return None
+
+def _leading_comments(head):
+    """The comment lines a file opens with (stripped, blank lines skipped), up to its first code line."""
+    comments = []
+    block_end = None
+    for line in head.splitlines():
+        stripped = line.strip()
+        if block_end:
+            comments.append(stripped)
+            if block_end in stripped:
+                block_end = None
+            continue
+        if not stripped or stripped.startswith('<?xml'):
+            continue
+        for start, end in _BLOCK_COMMENTS:
+            if stripped.startswith(start):
+                if end not in stripped[len(start):]:
+                    block_end = end
+                break
+        else:
+            if not stripped.startswith(_LINE_COMMENTS):
+                break
+        comments.append(stripped)
+    return '\n'.join(comments)
+
+def signature(content, digest=None):
+    """
+    MinHash signature (tuple of SIGNATURE_BUCKETS ints) of the content's word shingles,
+    or None if it's too short to compare. Memoized by content hash (`digest` if given).
+    """
+    key = ('minhash', digest or hashlib.sha1(content.encode('utf-8', 'surrogatepass')).hexdigest())
+    cached = memory_cache.get(key)
+    if cached is None:
+        cached = (_signature(content),)  # Wrapped: None is a valid result
+        memory_cache.put(key, cached, 8 * SIGNATURE_BUCKETS)
+    return cached[0]
+
+def _signature(content):
+    words = _WORDS.findall(content)
+    shingle_count = len(words) - SHINGLE_WORDS + 1
+    if shingle_count < MIN_SHINGLES:
+        return None
+    mins = [_EMPTY] * SIGNATURE_BUCKETS
+    crc32 = zlib.crc32
+    for i in range(shingle_count):
+        h = crc32(' '.join(words[i:i + SHINGLE_WORDS]).encode())
+        bucket = h % SIGNATURE_BUCKETS
+        if h < mins[bucket]:
+            mins[bucket] = h
+    return tuple(mins)
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of two signatures (buckets empty in both don't count)."""
+    same = used = 0
+    for x, y in zip(a, b):
+        if x == _EMPTY and y == _EMPTY:
+            continue
+        used += 1
+        same += x == y
+    return same / used if used else 0.0
+
+class DuplicateDetector:
+    """
+    Fed file records as they stream in (before the blueprint slims their content).
+    Generated and vendored files are set to IGNORE right away; near-duplicate
+    clusters are resolved once all files are in, keeping one representative each.
+    """
+    def __init__(self, threshold=DUPLICATE_THRESHOLD):
+        self.threshold = threshold
+        self.counts = {'generated': 0, 'vendored': 0, 'duplicate': 0}
+        self._signatures = []  # (file_record, signature)
+
+    def add(self, file_record):
+        """Checks one kept record; returns its redundancy reason (record now IGNORE) or None."""
+        reason = redundancy_reason(file_record)
+        if reason:
+            file_record['category'] = FileCategory.IGNORE
+            file_record['redundant'] = reason
+            self.counts[reason] += 1
+            return reason
+        if self.threshold > 0:
+            sig = signature(file_record.get('content', ''), file_record.get('blob'))
+            if sig is not None:
+                self._signatures.append((file_record, sig))
+        return None
+
+    def _clusters(self):
+        """Groups of indexes into _signatures whose members are near-duplicates."""
+        parent = list(range(len(self._signatures)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        bands = {}
+        for i, (_, sig) in enumerate(self._signatures):
+            for start in range(0, SIGNATURE_BUCKETS, BAND_ROWS):
+                band = sig[start:start + BAND_ROWS]
+                if _EMPTY not in band:
+                    bands.setdefault((start, band), []).append(i)
+
+        checked = set()
+        for members in bands.values():
+            if len(members) > MAX_PAIRWISE_BAND:
+                # Boilerplate shared by many files: compare against one member only
+                pairs = ((members[0], other) for other in members[1:])
+            else:
+                pairs = ((a, b) for n, a in enumerate(members) for b in members[n + 1:])
+            for a, b in pairs:
+                if (a, b) in checked or find(a) == find(b):
+                    continue
+                checked.add((a, b))
+                if similarity(self._signatures[a][1], self._signatures[b][1]) >= self.threshold:
+                    parent[find(b)] = find(a)
+
+        clusters = {}
+        for i in range(len(self._signatures)):
+            clusters.setdefault(find(i), []).append(i)
+        return [members for members in clusters.values() if len(members) > 1]
+
+    def collapse(self):
+        """
+        Keeps the most important file (graph_service rank, then ingest order) of each
+        near-duplicate cluster; the others become IGNORE with `duplicate_of` set, and the
+        representative lists them in `duplicates` and takes over their importance.
+        Returns the number of files collapsed.
+        """
+        collapsed = 0
+        for members in self._clusters():
+            records = [self._signatures[i][0] for i in sorted(members)]
+            keep = max(records, key=lambda f: f.get('importance', 1.0))  # First on ties
+            keep['duplicates'] = []
+            for file_record in records:
+                if file_record is keep:
+                    continue
+                keep['duplicates'].append(file_record['path'])
+                keep['importance'] = keep.get('importance', 1.0) + file_record.get('importance', 1.0)
+                file_record['category'] = FileCategory.IGNORE
+                file_record['redundant'] = 'duplicate'
+                file_record['duplicate_of'] = keep['path']
+                collapsed += 1
+        self.counts['duplicate'] += collapsed
+        self._signatures = []
+        return collapsed
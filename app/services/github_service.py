@@ -2,9 +2,17 @@
 import os
 import shutil
 import tempfile
+import time
 import uuid
-from git import Repo
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from git import Git, Repo
 import mimetypes
+import re
+from git.exc import UnsafeOptionError, UnsafeProtocolError
+from app.services.mirror_service import MIRROR_CACHE_ENABLED, checkout_from_mirror, open_mirror
 
 # Constants for filtering
 EXCLUDED_DIRS = {
@@ -20,6 +28,29 @@ EXCLUDED_EXTENSIONS = {
 
 MAX_FILE_SIZE_BYTES = 1000 * 1024  # 1MB limit per file
 
+# Whole-repo budgets: reading stops early (most important files first) once any is hit
+INGEST_MAX_TOTAL_BYTES = int(os.getenv('ROAST_INGEST_MAX_TOTAL_BYTES', str(10 * 1024 * 1024)))  # 10MB text
+INGEST_MAX_FILES = int(os.getenv('ROAST_INGEST_MAX_FILES', '20000'))
+INGEST_DEADLINE_SECONDS = float(os.getenv('ROAST_INGEST_DEADLINE_SECONDS', '60'))
+SKIPPED_PATHS_SAMPLE = 50  # How many skipped paths to list in meta
+
+# Read first when budgets are tight: manifests, then READMEs, then entry points
+MANIFEST_FILES = {
+    'package.json', 'requirements.txt', 'pyproject.toml', 'setup.py', 'setup.cfg', 'pipfile',
+    'go.mod', 'cargo.toml', 'pom.xml', 'build.gradle', 'build.gradle.kts', 'gemfile',
+    'composer.json', 'dockerfile', 'docker-compose.yml', 'docker-compose.yaml', 'makefile'
+}
+ENTRY_POINT_STEMS = {'main', 'app', 'index', 'server', 'run', 'wsgi', 'asgi', 'manage', '__main__', 'cli'}
+LS_REMOTE_TIMEOUT_SECONDS = 10
+# Remotes we accept from /ignite: https://, ssh:// and scp-style user@host:path
+ALLOWED_URL_SCHEMES = ('https://', 'ssh://')
+_SCP_LIKE_URL = re.compile(r'^[\w.-]+@[\w.-]+:[^:]')
+# 'objects': read blobs from the git object database (no checkout); 'checkout': export + os.walk
+INGEST_MODE = os.getenv('ROAST_INGEST_MODE', 'objects')
+# Parallel read/decode/line-count; in-flight bytes are those read but not yet merged
+INGEST_WORKERS = int(os.getenv('ROAST_INGEST_WORKERS', str(min(8, (os.cpu_count() or 1) * 2))))
+INGEST_MAX_INFLIGHT_BYTES = int(os.getenv('ROAST_INGEST_INFLIGHT_BYTES', str(32 * 1024 * 1024)))
+
 def detect_language(file_path):
     """Simple extension-based language detection."""
     _, ext = os.path.splitext(file_path)
@@ -49,94 +80,323 @@ def detect_language(file_path):
     }
     return mapping.get(ext, 'Unknown')
 
-def is_text_file(file_path):
-    """Check if a file is text or binary using mimetypes and content inspection."""
+def is_text_path(file_path):
+    """Path-only half of the text check: False if the mimetype says binary."""
+    if os.path.basename(file_path).lower() in MANIFEST_FILES:
+        return True  # package.json, pom.xml, go.mod... are typed application/*
     mime_type, _ = mimetypes.guess_type(file_path)
-    if mime_type and not mime_type.startswith('text'):
+    return not (mime_type and not mime_type.startswith('text'))
+
+def is_text_content(file_path, data):
+    """Text check on bytes already in memory: a text mimetype and no null bytes up front."""
+    if not is_text_path(file_path):
         return False
     
     # Fallback: Check for null bytes in the first 1024 bytes
+    return b'\0' not in data[:1024]
+
+def validate_repo_url(repo_url):
+    """
+    Raises ValueError unless repo_url is a plain https/ssh remote that is safe to hand
+    to git (no option injection like --upload-pack=..., no ext:: remote helpers).
+    """
+    if not isinstance(repo_url, str) or not repo_url.strip():
+        raise ValueError("No URL provided")
+    if repo_url.startswith('-') or any(c.isspace() for c in repo_url):
+        raise ValueError("Invalid repository URL")
+    if not (repo_url.lower().startswith(ALLOWED_URL_SCHEMES) or _SCP_LIKE_URL.match(repo_url)):
+        raise ValueError("Only https:// and ssh:// repository URLs are supported")
     try:
-        with open(file_path, 'rb') as f:
-            chunk = f.read(1024)
-            if b'\0' in chunk:
-                return False
-    except Exception:
+        # The same checks Repo.clone_from applies
+        Git.check_unsafe_protocols(repo_url)
+        Git.check_unsafe_options([repo_url], Repo.unsafe_git_clone_options)
+    except (UnsafeProtocolError, UnsafeOptionError):
+        raise ValueError("Invalid repository URL")
+
+def resolve_remote_head(repo_url):
+    """
+    Resolves the remote's default branch and its HEAD commit without cloning
+    (`git ls-remote --symref <url> HEAD`). Returns (commit_hash, default_branch).
+    Raises GitCommandError if the remote is unreachable or private.
+    """
+    output = Git().ls_remote(
+        '--symref', '--', repo_url, 'HEAD',  # '--': a URL starting with '-' is never an option
+        kill_after_timeout=LS_REMOTE_TIMEOUT_SECONDS,
+        env={'GIT_TERMINAL_PROMPT': '0'}  # Fail instead of prompting for credentials
+    )
+    commit_hash = None
+    default_branch = None
+    for line in output.splitlines():
+        ref, _, name = line.partition('\t')
+        if name != 'HEAD':
+            continue
+        if ref.startswith('ref: '):
+            default_branch = ref[len('ref: '):].replace('refs/heads/', '', 1)
+        else:
+            commit_hash = ref.strip()
+    if not commit_hash:
+        raise ValueError(f"Could not resolve HEAD for {repo_url}")
+    return commit_hash, default_branch
+
+def _is_candidate(rel_path, size):
+    """
+    Cheap filters that need only the path and size, applied before any read (and
+    before the whole-repo budgets, so binaries never use them up).
+    """
+    _, ext = os.path.splitext(rel_path)
+    if ext.lower() in EXCLUDED_EXTENSIONS:
         return False
+    if size > MAX_FILE_SIZE_BYTES:
+        return False
+    return is_text_path(rel_path)
+
+def file_priority(rel_path):
+    """
+    Sort key for ingestion order: manifests, READMEs, entry points, then everything
+    else; shallower paths first within each tier.
+    """
+    parts = rel_path.replace(os.sep, '/').split('/')
+    name = parts[-1].lower()
+    stem = os.path.splitext(name)[0]
+    if name in MANIFEST_FILES:
+        tier = 0
+    elif stem == 'readme':
+        tier = 1
+    elif stem in ENTRY_POINT_STEMS:
+        tier = 2
+    else:
+        tier = 3
+    return (tier, len(parts))
+
+def _build_file_record(rel_path, raw):
+    """Turns raw bytes into a file record, or None for binary content."""
+    if not is_text_content(rel_path, raw):
+        return None
+    content = raw.decode('utf-8', errors='ignore')
+    # Match text-mode reads (universal newlines) so content is identical in both modes
+    if '\r' in content:
+        content = content.replace('\r\n', '\n').replace('\r', '\n')
+    return {
+        'path': rel_path,
+        'content': content,
+        'lines': len(content.splitlines()),
+        'language': detect_language(rel_path)
+    }
+
+class _WorktreeSource:
+    """File source for a checked-out tree."""
+    def __init__(self, repo_path):
+        self.repo_path = repo_path
+
+    def entries(self):
+        """Yields (rel_path, size, key) in walk order."""
+        for root, dirs, files in os.walk(self.repo_path):
+            # Modify dirs in-place to skip excluded directories
+            dirs[:] = [d for d in dirs if d not in EXCLUDED_DIRS]
+            
+            for file in files:
+                file_path = os.path.join(root, file)
+                rel_path = os.path.relpath(file_path, self.repo_path)
+                yield rel_path, os.path.getsize(file_path), file_path
+
+    def read(self, file_path):
+        with open(file_path, 'rb') as f:
+            return f.read()
+
+    def close(self):
+        pass
+
+class _ObjectSource:
+    """
+    File source reading straight from the object database: one `git ls-tree -r -l`
+    for paths and sizes, blob reads over persistent cat-file processes.
+    Each pool thread gets its own Repo, since a cat-file pipe can't be shared.
+    """
+    def __init__(self, repo, commit_hash):
+        self.repo = repo
+        self.commit_hash = commit_hash
+        self._local = threading.local()
+        self._thread_repos = []
+        self._lock = threading.Lock()
+
+    def entries(self):
+        listing = self.repo.git.ls_tree('-r', '-l', '-z', '--full-tree', self.commit_hash)
+        for entry in listing.split('\0'):
+            if not entry:
+                continue
+            info, rel_path = entry.split('\t', 1)
+            mode, obj_type, sha, size = info.split()
+            # Skip submodules and symlinks (mode 120000 blobs)
+            if obj_type != 'blob' or mode == '120000':
+                continue
+            if any(part in EXCLUDED_DIRS for part in rel_path.split('/')[:-1]):
+                continue
+            yield rel_path, int(size), bytes.fromhex(sha)
+
+    def read(self, binsha):
+        repo = getattr(self._local, 'repo', None)
+        if repo is None:
+            repo = self._local.repo = Repo(self.repo.git_dir)
+            with self._lock:
+                self._thread_repos.append(repo)
+        return repo.odb.stream(binsha).read()
+
+    def close(self):
+        with self._lock:
+            for repo in self._thread_repos:
+                repo.close()
+            self._thread_repos = []
+
+def _read_record(source, rel_path, key):
+    try:
+        return _build_file_record(rel_path, source.read(key))
+    except Exception as e:
+        print(f"Error reading {rel_path}: {e}")
+        return None
+
+class IngestStream:
+    """
+    A repo being ingested. `url`, `meta` and `stats` are available up front (stats,
+    and meta['skipped'] when a budget cuts reading short, fill in as records flow);
+    iterating yields file records one at a time, most important files first.
+    Reads, decodes and line counts run on a thread pool; records come out in
+    priority order, so output is deterministic, and reading pauses once
+    INGEST_MAX_INFLIGHT_BYTES are read but not yet consumed.
+    """
+    def __init__(self, repo_url, commit_hash, default_branch, source):
+        self.url = repo_url
+        self.meta = {
+            'commit_hash': commit_hash,
+            'default_branch': default_branch
+        }
+        self.stats = {
+            'total_lines': 0,
+            'file_count': 0,
+            'languages': {}
+        }
+        self.source = source
+
+    def _count(self, file_record):
+        # Update stats
+        language = file_record['language']
+        self.stats['total_lines'] += file_record['lines']
+        self.stats['file_count'] += 1
+        self.stats['languages'][language] = self.stats['languages'].get(language, 0) + 1
+
+    def _skip(self, reason, rel_path):
+        skipped = self.meta.setdefault('skipped', {'total_bytes': 0, 'max_files': 0, 'deadline': 0, 'paths': []})
+        skipped[reason] += 1
+        if len(skipped['paths']) < SKIPPED_PATHS_SAMPLE:
+            skipped['paths'].append(rel_path)
+        self.meta['truncated'] = True
+
+    def _budgeted_entries(self):
+        """
+        Candidate entries, most important first, cut off by the whole-repo budgets.
+        Anything cut is counted in meta['skipped'].
+        """
+        candidates = [entry for entry in self.source.entries() if _is_candidate(entry[0], entry[1])]
+        candidates.sort(key=lambda entry: file_priority(entry[0]))  # Stable: listing order within a tier
         
-    return True
+        deadline = time.time() + INGEST_DEADLINE_SECONDS
+        total_bytes = 0
+        accepted = 0
+        for index, (rel_path, size, key) in enumerate(candidates):
+            if accepted >= INGEST_MAX_FILES or time.time() > deadline:
+                reason = 'max_files' if accepted >= INGEST_MAX_FILES else 'deadline'
+                for skipped_path, _, _ in candidates[index:]:
+                    self._skip(reason, skipped_path)
+                return
+            if total_bytes + size > INGEST_MAX_TOTAL_BYTES:
+                # Smaller files further down may still fit
+                self._skip('total_bytes', rel_path)
+                continue
+            total_bytes += size
+            accepted += 1
+            yield rel_path, size, key
 
-def ingest_repo(repo_url):
+    def __iter__(self):
+        pending = deque()  # (size, future) in priority order
+        inflight_bytes = 0
+        with ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix='ingest') as pool:
+            try:
+                for rel_path, size, key in self._budgeted_entries():
+                    while pending and (inflight_bytes + size > INGEST_MAX_INFLIGHT_BYTES
+                                       or len(pending) >= INGEST_WORKERS * 4):
+                        done_size, future = pending.popleft()
+                        inflight_bytes -= done_size
+                        file_record = future.result()
+                        if file_record is not None:
+                            self._count(file_record)
+                            yield file_record
+                    
+                    pending.append((size, pool.submit(_read_record, self.source, rel_path, key)))
+                    inflight_bytes += size
+                
+                while pending:
+                    _, future = pending.popleft()
+                    file_record = future.result()
+                    if file_record is not None:
+                        self._count(file_record)
+                        yield file_record
+            finally:
+                # Consumer stopped early: don't read what nobody will use
+                for _, future in pending:
+                    future.cancel()
+
+    def to_structure(self, files):
+        return {
+            'url': self.url,
+            'files': files,
+            'meta': self.meta,
+            'stats': self.stats
+        }
+
+@contextmanager
+def open_ingest_stream(repo_url):
     """
-    Clones a repo, filters files, and returns a structured representation.
+    Fetches/clones the repo and yields an IngestStream over its files. Git resources
+    (mirror lock, temp clone) are held until the block exits.
+    In 'objects' mode (default) files are read straight from git's object database,
+    with no working-tree checkout; 'checkout' mode exports the tree and walks it.
     """
+    if INGEST_MODE == 'objects' and MIRROR_CACHE_ENABLED:
+        with open_mirror(repo_url) as (repo, commit_hash, default_branch):
+            source = _ObjectSource(repo, commit_hash)
+            try:
+                yield IngestStream(repo_url, commit_hash, default_branch, source)
+            finally:
+                source.close()
+        return
+    
     temp_dir = tempfile.mkdtemp()
     repo_path = os.path.join(temp_dir, str(uuid.uuid4()))
     
     try:
-        # Clone the repository
-        Repo.clone_from(repo_url, repo_path, depth=1)
+        if INGEST_MODE == 'objects':
+            # Bare shallow clone: objects only, nothing written to a working tree
+            repo = Repo.clone_from(repo_url, repo_path, bare=True, depth=1, no_tags=True)
+            commit_hash = repo.head.commit.hexsha
+            default_branch = repo.active_branch.name
+            source = _ObjectSource(repo, commit_hash)
+            try:
+                yield IngestStream(repo_url, commit_hash, default_branch, source)
+            finally:
+                source.close()
+                repo.close()
+            return
         
-        commit_hash = Repo(repo_path).head.commit.hexsha
-        default_branch = Repo(repo_path).active_branch.name
-    
-        repo_structure = {
-            'url': repo_url,
-            'files': [],
-            'meta': {
-                'commit_hash': commit_hash,
-                'default_branch': default_branch
-            },
-            'stats': {
-                'total_lines': 0,
-                'file_count': 0,
-                'languages': {}
-            }
-        }
-        
-        for root, dirs, files in os.walk(repo_path):
-            # Modify dirs in-place to skip excluded directories
-            dirs[:] = [d for d in dirs if d not in EXCLUDED_DIRS]
+        if MIRROR_CACHE_ENABLED:
+            # Incremental fetch into the persistent mirror, then export HEAD
+            commit_hash, default_branch = checkout_from_mirror(repo_url, repo_path)
+        else:
+            # Clone the repository
+            Repo.clone_from(repo_url, repo_path, depth=1)
             
-            for file in files:
-                file_path = os.path.join(root, file)
-                rel_path = os.path.relpath(file_path, repo_path)
-                _, ext = os.path.splitext(file)
-                
-                if ext.lower() in EXCLUDED_EXTENSIONS:
-                    continue
-                
-                if os.path.getsize(file_path) > MAX_FILE_SIZE_BYTES:
-                    continue
-                
-                if not is_text_file(file_path):
-                    continue
-                
-                try:
-                    with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                        content = f.read()
-                        line_count = len(content.splitlines())
-                        
-                        language = detect_language(file_path)
-                        
-                        repo_structure['files'].append({
-                            'path': rel_path,
-                            'content': content,
-                            'lines': line_count,
-                            'language': language
-                        })
-                        
-                        # Update stats
-                        repo_structure['stats']['total_lines'] += line_count
-                        repo_structure['stats']['file_count'] += 1
-                        repo_structure['stats']['languages'][language] = \
-                            repo_structure['stats']['languages'].get(language, 0) + 1
-                            
-                except Exception as e:
-                    print(f"Error reading {rel_path}: {e}")
-                    continue
-
-        return repo_structure
+            commit_hash = Repo(repo_path).head.commit.hexsha
+            default_branch = Repo(repo_path).active_branch.name
+        
+        yield IngestStream(repo_url, commit_hash, default_branch, _WorktreeSource(repo_path))
         
     finally:
         # Cleanup
@@ -152,6 +412,14 @@ def ingest_repo(repo_url):
             
             shutil.rmtree(temp_dir, onerror=on_rm_error)
 
+def ingest_repo(repo_url):
+    """
+    Clones a repo, filters files, and returns a structured representation.
+    Holds every file in memory; the pipeline uses open_ingest_stream instead.
+    """
+    with open_ingest_stream(repo_url) as stream:
+        return stream.to_structure(list(stream))
+
 if __name__ == "__main__":
     # Test with a sample repo (e.g., this one or a popular one)
     test_url = "https://github.com/pallets/flask" # Example
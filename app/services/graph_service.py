@@ -0,0 +1,215 @@
+import os
+import re
+import posixpath
+
+# Import statements per language family, keyed by extension (detect_language doesn't
+# know .jsx/.tsx/.mjs). Each pattern captures the imported module specifier.
+_IMPORT_PATTERNS = {
+    'python': re.compile(r'^[ \t]*(?:from[ \t]+(\.*[\w.]*)[ \t]+import[ \t]+([\w, \t.*()]+)|import[ \t]+([\w., \t]+))', re.MULTILINE),
+    'js': re.compile(r'''(?:\bfrom|^[ \t]*import|\brequire[ \t]*\(|\bimport[ \t]*\()[ \t]*['"]([^'"\n]+)['"]''', re.MULTILINE),
+    'go': re.compile(r'^[ \t]*(?:[\w.]+[ \t]+)?"([\w./-]+)"', re.MULTILINE),  # Lines of an import ( ... ) block
+    'java': re.compile(r'^[ \t]*import[ \t]+(?:static[ \t]+)?([\w.]+(?:\.\*)?)[ \t]*;', re.MULTILINE)
+}
+_GO_IMPORT_BLOCK = re.compile(r'^import[ \t]*\((.*?)^\)', re.MULTILINE | re.DOTALL)
+_GO_SINGLE_IMPORT = re.compile(r'^import[ \t]+(?:[\w.]+[ \t]+)?"([\w./-]+)"', re.MULTILINE)
+_FAMILIES = {
+    '.py': 'python',
+    '.js': 'js', '.jsx': 'js', '.mjs': 'js', '.cjs': 'js', '.ts': 'js', '.tsx': 'js',
+    '.go': 'go',
+    '.java': 'java'
+}
+_JS_SUFFIXES = ['', '.ts', '.tsx', '.js', '.jsx', '.mjs', '.cjs',
+                '/index.ts', '/index.tsx', '/index.js', '/index.jsx']
+
+# PageRank over import edges (importer -> imported): a walk that starts at manifests,
+# READMEs and entry points (more often than elsewhere) and follows imports ends up at
+# the modules the repo is built around
+DAMPING = 0.85
+ITERATIONS = 30
+TOLERANCE = 1e-6  # Total score change below which iterating stops early
+TELEPORT_WEIGHTS = (4.0, 4.0, 4.0, 1.0)  # By github_service.file_priority tier
+
+def _family(path):
+    return _FAMILIES.get(os.path.splitext(path)[1].lower())
+
+def extract_imports(content, path):
+    """Raw import specifiers of one file (module names / relative paths), unresolved."""
+    family = _family(path)
+    if family is None:
+        return []
+    if family == 'python':
+        specs = []
+        for module, names, plain in _IMPORT_PATTERNS['python'].findall(content):
+            if plain:
+                specs.extend(name.split()[0] for name in plain.split(',') if name.strip())
+                continue
+            # from m import a: a may be a submodule (m.a) or a name in m; resolution
+            # takes the longest prefix that is a repo module
+            names = [name.split()[0] for name in names.strip('() \t').split(',') if name.strip()]
+            if not names:
+                specs.append(module)  # Parenthesized import spanning lines
+            separator = '' if module.endswith('.') else '.'
+            specs.extend(module + separator + name for name in names)
+        return specs
+    if family == 'go':
+        blocks = '\n'.join(_GO_IMPORT_BLOCK.findall(content))
+        return _IMPORT_PATTERNS['go'].findall(blocks) + _GO_SINGLE_IMPORT.findall(content)
+    return _IMPORT_PATTERNS[family].findall(content)
+
+class ImportGraph:
+    """
+    Lightweight import graph of one repo, filled while file records stream in
+    (the blueprint slims content away right after) and ranked once at the end.
+    Only imports that resolve to files of the repo become edges.
+    """
+    def __init__(self):
+        self.imports = {}  # path -> raw specifiers
+
+    def add(self, file_record):
+        specs = extract_imports(file_record.get('content', ''), file_record['path'])
+        if specs:
+            self.imports[file_record['path']] = specs
+
+    def edges(self, paths):
+        """importer -> set of imported repo paths."""
+        resolver = _Resolver(paths)
+        edges = {}
+        for path, specs in self.imports.items():
+            targets = resolver.resolve(path, specs)
+            targets.discard(path)
+            if targets:
+                edges[path] = targets
+        return edges
+
+    def rank(self, files):
+        """
+        Sets file['importance'] on every record: its PageRank scaled so the
+        average file scores 1.0. Returns the number of import edges used.
+        """
+        from app.services.github_service import file_priority  # github_service is heavy (GitPython)
+
+        paths = [f['path'] for f in files]
+        count = len(paths)
+        if not count:
+            return 0
+        index = {path: i for i, path in enumerate(paths)}
+        edges = [(index[path], [index[t] for t in targets]) for path, targets in self.edges(paths).items()]
+        has_edges = set(source for source, _ in edges)
+        dangling_nodes = [i for i in range(count) if i not in has_edges]
+        teleport = [TELEPORT_WEIGHTS[file_priority(path)[0]] for path in paths]
+        total_weight = sum(teleport)
+        teleport = [weight / total_weight for weight in teleport]
+
+        score = teleport
+        for _ in range(ITERATIONS):
+            # Rank of files importing nothing is spread like a teleport
+            dangling = sum(score[i] for i in dangling_nodes)
+            base = 1 - DAMPING + DAMPING * dangling
+            next_score = [base * weight for weight in teleport]
+            for source, targets in edges:
+                share = DAMPING * score[source] / len(targets)
+                for target in targets:
+                    next_score[target] += share
+            converged = sum(abs(new - old) for new, old in zip(next_score, score)) < TOLERANCE
+            score = next_score
+            if converged:
+                break
+
+        for file, value in zip(files, score):
+            file['importance'] = value * count
+        return sum(len(targets) for _, targets in edges)
+
+class _Resolver:
+    """Maps import specifiers to repo paths, per language family."""
+    def __init__(self, paths):
+        self.paths = set(paths)
+        self.python_modules = {}  # dotted suffix -> path (None when ambiguous)
+        self.java_classes = {}  # dotted suffix -> path
+        self.dirs = {}  # dir -> paths directly in it, for Go packages and Java wildcards
+        for path in paths:
+            stem, ext = os.path.splitext(path)
+            ext = ext.lower()
+            if ext == '.py':
+                parts = stem.split('/')
+                if parts[-1] == '__init__':
+                    parts = parts[:-1]
+                self._index_suffixes(self.python_modules, parts, path)
+            elif ext == '.java':
+                self._index_suffixes(self.java_classes, stem.split('/'), path)
+            self.dirs.setdefault(posixpath.dirname(path), []).append(path)
+
+    @staticmethod
+    def _index_suffixes(index, parts, path):
+        # src/app/x.py is reachable as app.x and x too (src/ layouts, sys.path tweaks)
+        for start in range(len(parts)):
+            key = '.'.join(parts[start:])
+            if not key:
+                continue
+            index[key] = None if index.get(key, path) != path else path
+
+    def resolve(self, importer, specs):
+        """Set of repo paths the importer's specifiers point at."""
+        resolve_one = {
+            'python': lambda spec: self._python(importer, spec),
+            'js': lambda spec: self._js(importer, spec),
+            'go': self._go,
+            'java': self._java
+        }.get(_family(importer))
+        targets = set()
+        if resolve_one is not None:
+            for spec in specs:
+                targets.update(resolve_one(spec))
+        return targets
+
+    def _python(self, importer, spec):
+        if spec.startswith('.'):
+            level = len(spec) - len(spec.lstrip('.'))
+            package = importer.split('/')[:-1]
+            if level > 1:
+                package = package[:-(level - 1)]
+            spec = '.'.join(package + [part for part in spec[level:].split('.') if part])
+        # `import a.b.c` also depends on a.b and a; the longest known prefix is the real target
+        parts = spec.split('.')
+        for end in range(len(parts), 0, -1):
+            key = '.'.join(parts[:end])
+            if key in self.python_modules:
+                path = self.python_modules[key]
+                return [path] if path else []  # Ambiguous: several files end with this name
+        return []
+
+    def _js(self, importer, spec):
+        if not spec.startswith('.'):
+            return []  # Package import
+        base = posixpath.normpath(posixpath.join(posixpath.dirname(importer), spec))
+        if base.endswith('.js'):
+            base_candidates = [base, base[:-3]]  # TS sources imported by their .js output name
+        else:
+            base_candidates = [base]
+        for candidate in base_candidates:
+            for suffix in _JS_SUFFIXES:
+                if candidate + suffix in self.paths:
+                    return [candidate + suffix]
+        return []
+
+    def _go(self, spec):
+        # module/path/pkg -> the deepest repo dir that the import path ends with
+        parts = spec.split('/')
+        for start in range(len(parts)):
+            go_files = [p for p in self.dirs.get('/'.join(parts[start:]), []) if p.endswith('.go')]
+            if go_files:
+                return go_files
+        return []
+
+    def _java(self, spec):
+        if spec.endswith('.*'):
+            package = spec[:-2].replace('.', '/')
+            for directory, paths in self.dirs.items():
+                if directory == package or directory.endswith('/' + package):
+                    return [p for p in paths if p.endswith('.java')]
+            return []
+        parts = spec.split('.')
+        for end in range(len(parts), 0, -1):  # Static imports name a member after the class
+            path = self.java_classes.get('.'.join(parts[:end]))
+            if path:
+                return [path]
+        return []
@@ -1,14 +1,160 @@
 
 import os
 import json
+import time
 import threading
 import hashlib
-from app.services.blueprint_service import generate_blueprint
+import mmap
+import struct
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+try:
+    import fcntl  # Cross-process locking (Linux / macOS); Windows dev boxes fall back to in-process only
+except ImportError:
+    fcntl = None
+from app.services.ai_prompts import SYSTEM_PROMPT, generate_user_prompt
+from app.services.blueprint_service import build_blueprint
+from app.services.token_service import estimate_tokens
+from app.services.serializer_service import CacheFormatError, atomic_write, cache_serializer
+from app.services.storage_service import ensure_local, publish, shared_store
+from app.services.scheduler_service import JobScheduler
 
 # Constants
-CACHE_DIR = os.path.join(os.getcwd(), 'app', 'cache')
-SAFE_CHAR_LIMIT = 4000000  # ~1M tokens, leveraging Gemini's large context window
-processing_lock = threading.Lock()
+CACHE_DIR = os.getenv('ROAST_CACHE_DIR') or os.path.join(os.getcwd(), 'app', 'cache')
+LOCK_DIR = os.path.join(CACHE_DIR, 'locks')
+# File contents, stored once by content hash and shared by every snapshot that has them
+BLOB_DIR = os.path.join(CACHE_DIR, 'blobs')
+SNAPSHOT_FORMAT = 'manifest-v1'
+# <hash>_repo.idx: header, sorted uint64 record offsets, then length-prefixed JSON records
+INDEX_MAGIC = b'RRIX'
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct('<4sBxxxI')  # magic, version, record count
+INDEX_OFFSET = struct.Struct('<Q')
+INDEX_LENGTH = struct.Struct('<I')
+# Estimated prompt tokens (system prompt + blueprint) we send to Gemini; files are reduced
+# to their interface past this. Leveraging Gemini's large context window.
+PROMPT_TOKEN_BUDGET = int(os.getenv('ROAST_PROMPT_TOKEN_BUDGET', '1000000'))
+# How long a roast is reused before /ignite regenerates it (0 disables reuse)
+CACHE_TTL_SECONDS = int(os.getenv('ROAST_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+# Corrupt cache files are moved here (not deleted) for inspection
+QUARANTINE_DIR = os.path.join(CACHE_DIR, 'quarantine')
+# Background integrity sweep of the cache dir (0 disables); temp files older than
+# STALE_TMP_SECONDS are leftovers from crashed writers
+CACHE_CHECK_INTERVAL_SECONDS = int(os.getenv('ROAST_CACHE_CHECK_INTERVAL_SECONDS', '3600'))
+STALE_TMP_SECONDS = 3600
+# Parallel blob uploads per snapshot when a shared store is configured
+SHARED_UPLOAD_WORKERS = 8
+# In-process cache of parsed results, snapshot manifests and blobs (bytes, not entries)
+MEMORY_CACHE_BYTES = int(os.getenv('ROAST_MEMORY_CACHE_BYTES', str(64 * 1024 * 1024)))
+# Python objects take more memory than their encoded payload (dicts, small ints, str
+# headers); measured with a recursive sys.getsizeof: ~3.3x for manifests, ~1.8x for results
+DECODED_SIZE_FACTORS = {'result': 2.0, 'snapshot': 3.5}
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+class ByteLRUCache:
+    """
+    Thread-safe LRU bounded by the approximate size of what it holds.
+    Each entry carries a validator (e.g. file mtime + size); a lookup with a
+    different validator is a miss, so rewritten files are never served stale.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (validator, value, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, validator=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != validator:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, size, validator=None):
+        if size > self.max_bytes:
+            return  # Never worth evicting everything else for one giant entry
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (validator, value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+memory_cache = ByteLRUCache(MEMORY_CACHE_BYTES)
+
+def _file_validator(path):
+    """(mtime_ns, size) of a file, or None if it doesn't exist. Doubles as a weak ETag."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def _load_cached(kind, path):
+    """
+    Decodes a cache file (any format cache_serializer can read) through the memory
+    cache. Returned objects are shared between callers and must be treated as read-only.
+    """
+    validator = _file_validator(path)
+    if validator is None:
+        return None
+    key = (kind, path)
+    data = memory_cache.get(key, validator)
+    if data is not None:
+        return data
+    try:
+        data, size = cache_serializer.load_file(path)
+    except OSError:
+        return None
+    except CacheFormatError as e:
+        # Valid, but written by another instance or a newer build with a format this
+        # process can't read: a miss, not corruption
+        print(f"Skipping cache entry {path}: {e}")
+        return None
+    except Exception as e:
+        # Truncated or garbled: move it aside so the next roast rewrites it
+        print(f"Corrupt cache entry {path}: {e}")
+        quarantine_entry(path)
+        return None
+    memory_cache.put(key, data, int(size * DECODED_SIZE_FACTORS[kind]), validator)
+    return data
+
+def _entry_lock(repo_hash):
+    """Lock serializing writers (and quarantine) of one repo hash's cache files across workers."""
+    return f"cache_{repo_hash}"
+
+def _shared_key(path):
+    """Shared store key of a file under CACHE_DIR."""
+    return 'cache/' + os.path.relpath(path, CACHE_DIR).replace(os.sep, '/')
 
 def ensure_cache_dir():
     if not os.path.exists(CACHE_DIR):
@@ -19,16 +165,21 @@ def get_repo_hash(repo_url, commit_hash):
     raw = f"{repo_url}::{commit_hash}"
     return hashlib.sha256(raw.encode()).hexdigest()
 
-def get_cached_result(repo_hash):
-    """Returns cached JSON if it exists."""
+def get_cached_result(repo_hash, max_age=None):
+    """
+    Returns cached JSON if it exists.
+    With max_age (seconds), results older than that are treated as missing.
+    """
     ensure_cache_dir()
     cache_path = os.path.join(CACHE_DIR, f"{repo_hash}.json")
-    if os.path.exists(cache_path):
-        try:
-            with open(cache_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception:
-            return None
+    if ensure_local(cache_path, _shared_key(cache_path)):
+        if max_age is not None:
+            try:
+                if time.time() - os.path.getmtime(cache_path) > max_age:
+                    return None
+            except OSError:
+                return None
+        return _load_cached('result', cache_path)
     return None
 
 def save_result(repo_hash, result_json):
@@ -36,72 +187,560 @@ def save_result(repo_hash, result_json):
     ensure_cache_dir()
     cache_path = os.path.join(CACHE_DIR, f"{repo_hash}.json")
     try:
-        with open(cache_path, 'w', encoding='utf-8') as f:
-            json.dump(result_json, f, indent=2)
+        with process_lock(_entry_lock(repo_hash)):
+            cache_serializer.dump_file(result_json, cache_path)
+        publish(cache_path, _shared_key(cache_path))
     except Exception as e:
         print(f"Failed to cache result: {e}")
 
+def blob_id_for(content):
+    """Git-style blob id (sha1 of 'blob <len>\\0' + bytes) of the UTF-8 content."""
+    data = content.encode('utf-8')
+    digest = hashlib.sha1(b'blob %d\0' % len(data))
+    digest.update(data)
+    return digest.hexdigest()
+
+def _blob_path(blob_id):
+    return os.path.join(BLOB_DIR, blob_id[:2], blob_id[2:])
+
+def _store_blob(content):
+    """
+    Stores content in the content-addressed store; returns (blob id, whether it was new on
+    this disk). Content already stored (same file in another commit or repo) is not rewritten.
+    """
+    blob_id = blob_id_for(content)
+    path = _blob_path(blob_id)
+    try:
+        # Reused: refresh the mtime so blob GC's grace period (cache_service) covers it
+        # until the manifest referencing it is written
+        os.utime(path)
+        return blob_id, False
+    except FileNotFoundError:
+        pass  # New, or collected just now
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Not fsynced (one per file would dominate ingestion); a torn blob fails its
+    # hash check and is quarantined by the cache checker
+    with atomic_write(path, 'w', durable=False, encoding='utf-8', newline='') as f:
+        f.write(content)
+    return blob_id, True
+
+def get_blob(blob_id):
+    """Returns stored content for a blob id, or None."""
+    if not blob_id or not blob_id.isalnum():
+        return None
+    # Blobs are immutable (named by their content), so no validator is needed
+    key = ('blob', blob_id)
+    content = memory_cache.get(key)
+    if content is not None:
+        return content
+    path = _blob_path(blob_id)
+    if not ensure_local(path, _shared_key(path)):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            content = f.read()
+    except OSError:
+        return None
+    memory_cache.put(key, content, len(content))
+    return content
+
+def _manifest_entry(file_record):
+    """
+    Compact manifest line for a file: everything but the content, plus its blob id.
+    The blob id is set on the record too: later stages key their memos by it instead
+    of hashing the content again. Returns (entry, created) where created says the
+    blob was new on this disk.
+    """
+    file_record['blob'], created = _store_blob(file_record.get('content', ''))
+    entry = {k: v for k, v in file_record.items() if k not in ('content', 'interface')}
+    return entry, created
+
 def get_repo_data(repo_hash):
-    """Returns the full cached repository structure (files and content)."""
+    """
+    Returns the cached repository snapshot: url, meta, stats and the file manifest
+    (path, blob, language, lines, category). Content is not loaded; use get_repo_file.
+    Older snapshots with inline content are returned as they are.
+    """
     ensure_cache_dir()
-    cache_path = os.path.join(CACHE_DIR, f"{repo_hash}_repo.json")
-    if os.path.exists(cache_path):
+    if _ensure_snapshot_local(repo_hash):
+        return _load_cached('snapshot', os.path.join(CACHE_DIR, f"{repo_hash}_repo.json"))
+    return None
+
+def _ensure_snapshot_local(repo_hash):
+    """True if the snapshot manifest is on local disk, fetching index + manifest from the shared store if not."""
+    manifest_path = os.path.join(CACHE_DIR, f"{repo_hash}_repo.json")
+    if os.path.exists(manifest_path):
+        return True
+    if shared_store is None or not repo_hash.isalnum():
+        return False
+    # Index first, same visibility order as SnapshotWriter
+    ensure_local(_index_path(repo_hash), _shared_key(_index_path(repo_hash)))
+    return ensure_local(manifest_path, _shared_key(manifest_path))
+
+def snapshot_validator(repo_hash):
+    """
+    (mtime_ns, size) of the snapshot's path index (its manifest for snapshots without one),
+    or None if the repo is unknown. Changes whenever the snapshot is rewritten.
+    """
+    if not _ensure_snapshot_local(repo_hash):
+        return None
+    return _file_validator(_index_path(repo_hash)) or _file_validator(
+        os.path.join(CACHE_DIR, f"{repo_hash}_repo.json"))
+
+def _index_path(repo_hash):
+    return os.path.join(CACHE_DIR, f"{repo_hash}_repo.idx")
+
+def write_snapshot_index(repo_hash, entries):
+    """Writes the path index for a snapshot from its manifest entries."""
+    entries = sorted(entries, key=lambda entry: entry['path'])
+    records = [json.dumps(entry, separators=(',', ':')).encode('utf-8') for entry in entries]
+    with atomic_write(_index_path(repo_hash)) as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(records)))
+        offset = INDEX_HEADER.size + INDEX_OFFSET.size * len(records)
+        for record in records:
+            f.write(INDEX_OFFSET.pack(offset))
+            offset += INDEX_LENGTH.size + len(record)
+        for record in records:
+            f.write(INDEX_LENGTH.pack(len(record)))
+            f.write(record)
+
+class SnapshotIndex:
+    """
+    Memory-mapped path index of one snapshot. A lookup is a binary search that
+    decodes ~log2(n) small records; listing paths never touches file contents.
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count = INDEX_HEADER.unpack_from(self._mm, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            self._mm.close()
+            raise ValueError(f"Unsupported snapshot index {path}")
+
+    @classmethod
+    def open(cls, repo_hash):
+        """
+        Returns the (shared, memory-cached) index for repo_hash, or None if the
+        snapshot has none. The mapping is released when the index is evicted.
+        """
+        path = _index_path(repo_hash)
+        validator = _file_validator(path)
+        if validator is None:
+            return None
+        key = ('index', path)
+        index = memory_cache.get(key, validator)
+        if index is not None:
+            return index
         try:
-            with open(cache_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception:
+            index = cls(path)
+        except (OSError, ValueError, struct.error):
             return None
-    return None
+        memory_cache.put(key, index, validator[1], validator)
+        return index
 
-def save_repo_data(repo_hash, repo_data):
-    """Saves the full repo structure to cache (for code viewer)."""
-    ensure_cache_dir()
-    cache_path = os.path.join(CACHE_DIR, f"{repo_hash}_repo.json")
+    def _record(self, i):
+        (offset,) = INDEX_OFFSET.unpack_from(self._mm, INDEX_HEADER.size + i * INDEX_OFFSET.size)
+        (length,) = INDEX_LENGTH.unpack_from(self._mm, offset)
+        start = offset + INDEX_LENGTH.size
+        return json.loads(self._mm[start:start + length])
+
+    def lookup(self, path):
+        if not isinstance(path, str):
+            return None
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry = self._record(mid)
+            if entry['path'] == path:
+                return entry
+            if entry['path'] < path:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def entries(self):
+        for i in range(self.count):
+            yield self._record(i)
+
+
+def list_repo_paths(repo_hash):
+    """Sorted file paths of a snapshot, or None if the repo is unknown."""
+    _ensure_snapshot_local(repo_hash)
+    index = SnapshotIndex.open(repo_hash)
+    if index:
+        return [entry['path'] for entry in index.entries()]
+    repo_data = get_repo_data(repo_hash)
+    if not repo_data:
+        return None
+    return sorted(f['path'] for f in repo_data['files'])
+
+def get_repo_file(repo_hash, path):
+    """Returns one file record with its content, or None if the repo or path is unknown."""
+    _ensure_snapshot_local(repo_hash)
+    index = SnapshotIndex.open(repo_hash)
+    if index:
+        file_obj = index.lookup(path)
+    else:
+        # Snapshot written before the index existed
+        repo_data = get_repo_data(repo_hash)
+        if not repo_data:
+            return None
+        file_obj = next((f for f in repo_data['files'] if f['path'] == path), None)
+    if not file_obj:
+        return None
+    if 'content' not in file_obj:
+        file_obj = dict(file_obj, content=get_blob(file_obj.get('blob')) or '')
+    return file_obj
+
+def has_repo_data(repo_hash):
+    """Cheap existence check for the code viewer snapshot (no parsing; a shared store lookup on a local miss)."""
+    return _ensure_snapshot_local(repo_hash)
+
+class SnapshotWriter:
+    """
+    Streams a repo snapshot one file record at a time, so the code viewer copy
+    never has to exist in memory as a whole. Contents go to the content-addressed
+    blob store (written only if new) as they arrive; only the small manifest
+    entries are kept, and on a clean exit they are encoded with cache_serializer
+    into <hash>_repo.json (name kept for old snapshots; the header says the format)
+    next to a sorted, memory-mappable path index (<hash>_repo.idx).
+    `meta` and `stats` are written last, so they may keep changing while files stream in.
+    With a shared store, new blobs are uploaded in the background while files stream
+    in, and the index and manifest are published once all of them are there.
+    """
+    def __init__(self, repo_hash, repo_url, meta):
+        ensure_cache_dir()
+        self.path = os.path.join(CACHE_DIR, f"{repo_hash}_repo.json")
+        self.repo_url = repo_url
+        self.meta = meta
+        self.stats = None
+        self.repo_hash = repo_hash
+        self._entries = []  # Manifest entries (no content)
+        self._uploads = None
+        self._pending = []
+
+    def __enter__(self):
+        if shared_store is not None:
+            self._uploads = ThreadPoolExecutor(max_workers=SHARED_UPLOAD_WORKERS)
+        return self
+
+    def add(self, file_record):
+        entry, created = _manifest_entry(file_record)
+        self._entries.append(entry)
+        if created and self._uploads:
+            path = _blob_path(entry['blob'])
+            self._pending.append(self._uploads.submit(publish, path, _shared_key(path), True))
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._uploads:
+            self._uploads.shutdown(wait=exc_type is None, cancel_futures=exc_type is not None)
+        if exc_type is not None:
+            return False
+        try:
+            with process_lock(_entry_lock(self.repo_hash)):
+                # Index first: a snapshot is only visible (has_repo_data) once both exist
+                write_snapshot_index(self.repo_hash, self._entries)
+                cache_serializer.dump_file({
+                    'format': SNAPSHOT_FORMAT,
+                    'url': self.repo_url,
+                    'files': self._entries,
+                    'meta': self.meta,
+                    'stats': self.stats or {}
+                }, self.path)
+        except Exception as e:
+            print(f"Failed to cache repo data: {e}")
+            return False
+        try:
+            for upload in self._pending:
+                upload.result()
+            index_path = _index_path(self.repo_hash)
+            publish(index_path, _shared_key(index_path))
+            publish(self.path, _shared_key(self.path))
+        except Exception as e:
+            # The local snapshot is fine; other instances just re-ingest
+            print(f"Failed to publish repo data to the shared store: {e}")
+        return False
+
+def _repo_hash_of(path):
+    """Repo hash a top-level cache file belongs to (<hash>.json, <hash>_repo.json, <hash>_repo.idx)."""
+    return os.path.basename(path).split('_', 1)[0].split('.', 1)[0]
+
+def verify_cache_entry(path):
+    """
+    True if a cache file decodes cleanly (results, manifests, indexes) or matches its id
+    (blobs). Files in a format this process can't decode are left alone: True.
+    """
     try:
-        with open(cache_path, 'w', encoding='utf-8') as f:
-            json.dump(repo_data, f, indent=2)
-    except Exception as e:
-        print(f"Failed to cache repo data: {e}")
+        if os.path.dirname(os.path.dirname(path)) == BLOB_DIR:
+            blob_id = os.path.basename(os.path.dirname(path)) + os.path.basename(path)
+            with open(path, 'rb') as f:
+                data = f.read()
+            digest = hashlib.sha1(b'blob %d\0' % len(data))
+            digest.update(data)
+            return digest.hexdigest() == blob_id
+        if path.endswith('_repo.idx'):
+            index = SnapshotIndex(path)
+            try:
+                previous = None
+                for entry in index.entries():
+                    if previous is not None and entry['path'] <= previous:
+                        return False
+                    previous = entry['path']
+            finally:
+                index._mm.close()
+            return True
+        data, _ = cache_serializer.load_file(path)
+        if path.endswith('_repo.json'):
+            return isinstance(data, dict) and isinstance(data.get('files'), list)
+        return isinstance(data, dict)
+    except FileNotFoundError:
+        return True  # Gone (replaced or evicted) is not corrupt
+    except CacheFormatError:
+        return True  # A format this process can't decode is not corrupt either
+    except Exception:
+        return False
+
+def quarantine_entry(path):
+    """
+    Moves a corrupt cache file to app/cache/quarantine, re-verifying it under the
+    entry's lock first so a file that was just rewritten is left alone.
+    Returns True if the file was quarantined.
+    """
+    is_blob = os.path.dirname(os.path.dirname(path)) == BLOB_DIR
+    lock_key = 'blob' if is_blob else _entry_lock(_repo_hash_of(path))
+    with process_lock(lock_key, blocking=False) as acquired:
+        if not acquired or verify_cache_entry(path):
+            return False
+        os.makedirs(QUARANTINE_DIR, exist_ok=True)
+        name = os.path.basename(path)
+        if is_blob:
+            name = os.path.basename(os.path.dirname(path)) + name
+        try:
+            os.replace(path, os.path.join(QUARANTINE_DIR, f"{name}.{int(time.time())}"))
+        except FileNotFoundError:
+            return False
+    for kind in ('result', 'snapshot', 'index'):
+        memory_cache.invalidate((kind, path))
+    if is_blob:
+        memory_cache.invalidate(('blob', name))
+    print(f"Quarantined corrupt cache entry {path}")
+    return True
+
+def _cache_files():
+    """Top-level cache files plus blobs (locks, jobs, mirrors and quarantine are skipped)."""
+    for root in (CACHE_DIR, BLOB_DIR):
+        if not os.path.isdir(root):
+            continue
+        dirs = [root] if root == CACHE_DIR else [os.path.join(root, d) for d in os.listdir(root)]
+        for directory in dirs:
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                continue
+            for name in names:
+                path = os.path.join(directory, name)
+                if os.path.isfile(path):
+                    yield path
+
+class CacheChecker:
+    """
+    Background integrity sweep: verifies results, snapshot manifests, path indexes
+    and blobs, quarantines corrupt ones, and removes temp files left behind by
+    crashed writers. Only files changed since the previous sweep (by any worker,
+    tracked through a stamp file) are verified, and only one worker sweeps at a time.
+    """
+    def __init__(self, interval):
+        self.interval = interval
+        self.stamp_path = os.path.join(CACHE_DIR, 'checker.stamp')
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name='cache-checker', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Cache check failed: {e}")
+
+    def sweep(self):
+        """Runs one pass; returns {'checked', 'quarantined', 'tmp_removed'} or None if another worker is sweeping."""
+        with process_lock('cache_checker', blocking=False) as acquired:
+            if not acquired:
+                return None
+            started = time.time()
+            try:
+                since = os.path.getmtime(self.stamp_path)
+            except OSError:
+                since = 0
+            report = {'checked': 0, 'quarantined': 0, 'tmp_removed': 0}
+            for path in _cache_files():
+                try:
+                    mtime = os.path.getmtime(path)
+                except OSError:
+                    continue
+                if path.endswith('.tmp'):
+                    if started - mtime > STALE_TMP_SECONDS:
+                        try:
+                            os.remove(path)
+                            report['tmp_removed'] += 1
+                        except OSError:
+                            pass
+                    continue
+                if not path.endswith(('.json', '.idx')) and os.path.dirname(os.path.dirname(path)) != BLOB_DIR:
+                    continue
+                # Files rewritten during the previous sweep are checked again (mtime >= since)
+                if mtime < since:
+                    continue
+                report['checked'] += 1
+                if not verify_cache_entry(path) and quarantine_entry(path):
+                    report['quarantined'] += 1
+            ensure_cache_dir()
+            with open(self.stamp_path, 'a'):
+                pass
+            os.utime(self.stamp_path, (started, started))
+            if report['quarantined'] or report['tmp_removed']:
+                print(f"Cache check: {report}")
+            return report
+
+cache_checker = CacheChecker(CACHE_CHECK_INTERVAL_SECONDS)
 
 def estimate_and_prune(repo_structure):
     """
-    Checks blueprint size. If too large, reduces FULL_CODE files to INTERFACE_ONLY.
-    Returns the final blueprint string.
-    """
-    blueprint = generate_blueprint(repo_structure)
-    
-    if len(blueprint) <= SAFE_CHAR_LIMIT:
-        return blueprint
-    
-    print(f"Blueprint size {len(blueprint)} exceeds limit {SAFE_CHAR_LIMIT}. Pruning...")
-    
-    # Pruning Strategy: Downgrade FULL_CODE files to INTERFACE_ONLY, starting from the largest
-    # We keep the files sorted by size to prune effectively
-    full_code_files = [f for f in repo_structure['files'] if f.get('category') == 'FULL_CODE']
-    full_code_files.sort(key=lambda x: len(x.get('content', '')), reverse=True)
-    
-    for file in full_code_files:
-        # Downgrade
-        file['category'] = 'INTERFACE_ONLY'
-        # Re-generate to check size
-        blueprint = generate_blueprint(repo_structure)
-        if len(blueprint) <= SAFE_CHAR_LIMIT:
-            print(f"Pruned down to {len(blueprint)} chars.")
-            return blueprint
-            
-    # If still too large, return as is (Gemini 1.5 Pro is huge mostly, this is just a latency guard)
-    print("Warning: Still exceeds safe limit after pruning all FULL_CODE files.")
+    Checks the estimated prompt size in tokens. If over PROMPT_TOKEN_BUDGET, reduces
+    FULL_CODE files to INTERFACE_ONLY, then drops interfaces, least important files
+    first. Returns the final blueprint string.
+    """
+    # Everything in the request except the blueprint itself
+    prompt_overhead = estimate_tokens(SYSTEM_PROMPT + "\n\n" + generate_user_prompt(''))
+    budget = PROMPT_TOKEN_BUDGET - prompt_overhead
+    blueprint, downgraded, dropped, tokens = build_blueprint(repo_structure, budget, measure=estimate_tokens)
+    if downgraded or dropped:
+        print(f"Pruned {downgraded} FULL_CODE files to their interface and dropped {dropped} "
+              f"interfaces, down to ~{tokens} tokens ({len(blueprint)} chars).")
+    if tokens > budget:
+        # Only the tree listing is left to cut (Gemini's window is huge, this is just a latency guard)
+        print(f"Warning: Still ~{tokens} tokens after pruning every file (budget {budget}).")
     return blueprint
 
+class SingleFlight:
+    """
+    Coalesces concurrent work on the same key: the first caller runs fn, everyone
+    else waits and gets the same result (or exception). Callers in other gunicorn
+    workers are serialized through a lock file, so by the time they run fn the
+    leader's result is already in the cache. on_wait, if given, is called before a
+    caller blocks behind another one (to release what it holds meanwhile).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, on_wait=None):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {'done': threading.Event(), 'result': None, 'error': None}
+                self._calls[key] = call
+
+        if not leader:
+            if on_wait:
+                on_wait()
+            call['done'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+
+        try:
+            with process_lock(key, blocking=False) as acquired:
+                if acquired:
+                    call['result'] = fn()
+            if not acquired:
+                if on_wait:
+                    on_wait()
+                with process_lock(key):
+                    call['result'] = fn()
+            return call['result']
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['done'].set()
+
+@contextmanager
+def process_lock(key, shared=False, blocking=True):
+    """
+    flock on app/cache/locks/<key>.lock, shared or exclusive, across threads and
+    gunicorn workers. With blocking=False, yields False instead of waiting when
+    the lock is held elsewhere. A no-op (always acquired) where fcntl is unavailable.
+    The holder may delete the lock file (remove_lock_file); whoever was waiting on the
+    deleted file locks the one now at the path instead.
+    """
+    if fcntl is None:
+        yield True
+        return
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    path = _lock_path(key)
+    flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+    if not blocking:
+        flags |= fcntl.LOCK_NB
+    while True:
+        fh = open(path, 'a')
+        try:
+            fcntl.flock(fh, flags)
+            try:
+                current = os.stat(path)
+            except FileNotFoundError:
+                current = None
+        except BlockingIOError:
+            fh.close()
+            yield False
+            return
+        except BaseException:
+            fh.close()
+            raise
+        if current is not None and os.path.samestat(current, os.fstat(fh.fileno())):
+            break
+        fh.close()  # Deleted while we waited
+    try:
+        yield True
+    finally:
+        fcntl.flock(fh, fcntl.LOCK_UN)
+        fh.close()
+
+def _lock_path(key):
+    return os.path.join(LOCK_DIR, f"{key}.lock")
+
+def remove_lock_file(key):
+    """Deletes a lock's file. Only call while holding it exclusively (see process_lock)."""
+    try:
+        os.remove(_lock_path(key))
+    except FileNotFoundError:
+        pass
+
+single_flight = SingleFlight()
+
 class Guardrail:
     """Singleton-like access to locks and state."""
     @staticmethod
-    def acquire_processing_lock():
-        return processing_lock.acquire(blocking=False)
-    
-    @staticmethod
-    def release_processing_lock():
-        processing_lock.release()
+    def scheduler():
+        """Per-process job scheduler that bounds concurrent roast pipelines."""
+        global _scheduler
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = JobScheduler()
+        return _scheduler
 
 if __name__ == "__main__":
     # Test Stub
@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import uuid
+import threading
+from app.services.guardrail_service import CACHE_DIR, Guardrail
+from app.services.metrics_service import JobTrace
+from app.services.scheduler_service import PRIORITY_NORMAL, SchedulerBusy
+
+# Job state lives on disk too, so a poll that lands on another gunicorn worker still finds it.
+# It is per instance: multi-instance deployments need session affinity (DEPLOYMENT.md)
+JOBS_DIR = os.path.join(CACHE_DIR, 'jobs')
+JOB_RETENTION_SECONDS = 3600  # Finished jobs are forgotten after an hour
+
+def ensure_jobs_dir():
+    if not os.path.exists(JOBS_DIR):
+        os.makedirs(JOBS_DIR)
+
+class Job:
+    """Status of one roast request. Every state change is appended to `events`."""
+    def __init__(self, repo_url, options=None, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.repo_url = repo_url
+        self.options = options or {}
+        self.status = 'queued'  # queued | running | done | error
+        self.stage = 'queued'
+        self.repo_hash = None
+        self.error = None
+        self.error_status = None
+        self.events = []
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.scheduled = None  # ScheduledJob handle while waiting for a slot
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'error')
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'repo_url': self.repo_url,
+            'status': self.status,
+            'stage': self.stage,
+            'repo_hash': self.repo_hash,
+            'error': self.error,
+            'error_status': self.error_status,
+            'events': self.events,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
+        }
+
+class JobManager:
+    """
+    Runs roast pipelines on the Guardrail scheduler and tracks their progress.
+    The pipeline callable receives (repo_url, report, **options) where
+    report(stage, message) records progress; it returns the repo hash, or raises
+    to fail the job. Identical requests already in flight share one job.
+    """
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self._jobs = {}
+        self._inflight = {}  # coalescing key -> unfinished Job
+        self._cond = threading.Condition()
+
+    @staticmethod
+    def _key(repo_url, options):
+        url = repo_url.strip().rstrip('/')
+        if url.endswith('.git'):
+            url = url[:-4]
+        return (url.lower(), tuple(sorted(options.items())))
+
+    def submit(self, repo_url, priority=PRIORITY_NORMAL, **options):
+        """
+        Creates and queues a job, or returns the in-flight job for the same repo.
+        Raises SchedulerBusy when the backlog is full.
+        """
+        key = self._key(repo_url, options)
+        with self._cond:
+            existing = self._inflight.get(key)
+            if existing and not existing.finished:
+                return existing
+            self._prune_locked()
+            job = Job(repo_url, options)
+            self._jobs[job.id] = job
+            self._inflight[key] = job
+        self._record(job, 'queued', "Waiting for a free roaster...")
+        try:
+            job.scheduled = Guardrail.scheduler().submit(self._run, job, key, priority=priority)
+        except SchedulerBusy:
+            self._forget(job.id, key)
+            raise
+        return job
+
+    def _run(self, job, key):
+        job.status = 'running'
+        with JobTrace(job.id, job.repo_url) as trace:
+            try:
+                repo_hash = self.pipeline(job.repo_url, lambda stage, message: self._record(job, stage, message),
+                                          **job.options)
+                job.repo_hash = repo_hash
+                trace.notes['repo_hash'] = repo_hash
+                self._record(job, 'done', "Roast ready.", status='done')
+            except Exception as e:
+                print(f"Critical error in job {job.id}: {e}")
+                job.error = str(e)
+                job.error_status = getattr(e, 'status', 500)
+                trace.notes['error'] = job.error
+                self._record(job, job.stage, f"ERROR: {job.error}", status='error')
+            finally:
+                trace.status = job.status
+                job.scheduled = None
+                with self._cond:
+                    if self._inflight.get(key) is job:
+                        del self._inflight[key]
+
+    def _record(self, job, stage, message, status=None):
+        # Status and the event that announces it change together, so readers never see one without the other
+        with self._cond:
+            if status:
+                job.status = status
+            job.stage = stage
+            job.updated_at = time.time()
+            job.events.append({'seq': len(job.events), 'stage': stage, 'message': message, 'time': job.updated_at})
+            self._cond.notify_all()
+        self._persist(job)
+
+    def _persist(self, job):
+        ensure_jobs_dir()
+        path = os.path.join(JOBS_DIR, f"{job.id}.json")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            # Serialize and rename under the lock so a stale snapshot never replaces a newer one
+            with self._cond:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(job.to_dict(), f)
+                os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Failed to persist job {job.id}: {e}")
+
+    def _forget(self, job_id, key):
+        with self._cond:
+            self._jobs.pop(job_id, None)
+            if key in self._inflight and self._inflight[key].id == job_id:
+                del self._inflight[key]
+        try:
+            os.remove(os.path.join(JOBS_DIR, f"{job_id}.json"))
+        except OSError:
+            pass
+
+    def _prune_locked(self):
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        for job_id in [j.id for j in self._jobs.values() if j.finished and j.updated_at < cutoff]:
+            del self._jobs[job_id]
+            try:
+                os.remove(os.path.join(JOBS_DIR, f"{job_id}.json"))
+            except OSError:
+                pass
+
+    def get(self, job_id):
+        """Returns the job state dict, from memory or from another worker's state file."""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job:
+                state = job.to_dict()
+                scheduled = job.scheduled
+            else:
+                scheduled = None
+        if not job:
+            state = self._load(job_id)
+            if not state:
+                return None
+        if scheduled is not None and state['status'] == 'queued':
+            scheduler = Guardrail.scheduler()
+            state['position'] = scheduler.position(scheduled)
+            state['eta_seconds'] = scheduler.eta(scheduled)
+        return state
+
+    def _load(self, job_id):
+        # Job IDs are uuid4 hex; refuse anything else before touching the filesystem
+        if not job_id.isalnum():
+            return None
+        path = os.path.join(JOBS_DIR, f"{job_id}.json")
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def wait_for_events(self, job_id, since, timeout):
+        """
+        Blocks until the job has events past `since` (or timeout).
+        Returns the job state dict, or None if the job is unknown.
+        """
+        deadline = time.time() + timeout
+        while True:
+            with self._cond:
+                job = self._jobs.get(job_id)
+                # Checked and waited on under the lock, so an event recorded in between
+                # can't notify before we wait
+                while job is not None and len(job.events) <= since and not job.finished:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            if job is not None:
+                return self.get(job_id)
+            # Job belongs to another worker process: poll its state file
+            state = self.get(job_id)
+            if state is None or len(state['events']) > since or state['status'] in ('done', 'error'):
+                return state
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return state
+            time.sleep(min(0.5, remaining))
@@ -0,0 +1,284 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from app.services.guardrail_service import CACHE_DIR, memory_cache
+from app.services.serializer_service import atomic_write
+try:
+    import resource  # Fallback for peak memory where /proc isn't available (not on Windows)
+except ImportError:
+    resource = None
+
+# Each gunicorn worker keeps its own metrics and snapshots them here; /metrics (answered by
+# whichever worker gets the scrape) merges every snapshot, like jobs/ does for job state
+METRICS_DIR = os.path.join(CACHE_DIR, 'metrics')
+METRICS_RETENTION_SECONDS = 7 * 24 * 3600  # Snapshots of workers gone this long are dropped
+MEMORY_SAMPLE_SECONDS = float(os.getenv('ROAST_MEMORY_SAMPLE_SECONDS', '0.05'))
+
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# name -> (type, help). Gauges here are high-water marks: merged across workers by max.
+# memory_cache series are sampled when a snapshot is written and summed across workers.
+METRICS = {
+    'reporoast_stage_seconds': ('histogram', "Wall time of a pipeline stage (tts_turn: one dialogue turn)."),
+    'reporoast_stage_peak_rss_bytes': ('gauge', "Highest process RSS sampled while a stage ran."),
+    'reporoast_cache_hits_total': ('counter', "Roasts served from the result cache, by where the hit happened."),
+    'reporoast_rejections_total': ('counter', "/ignite requests answered 503 because the queue was full."),
+    'reporoast_blueprint_bytes_total': ('counter', "UTF-8 bytes of blueprints sent to Gemini."),
+    'reporoast_jobs_total': ('counter', "Finished roast jobs, by outcome."),
+    'reporoast_memory_cache_entries': ('gauge', "Entries in the in-process LRU (results, snapshots, blobs, memoized scans)."),
+    'reporoast_memory_cache_bytes': ('gauge', "Approximate bytes held by the in-process LRU."),
+    'reporoast_memory_cache_max_bytes': ('gauge', "In-process LRU capacity (ROAST_MEMORY_CACHE_BYTES per worker)."),
+    'reporoast_memory_cache_hits': ('gauge', "In-process LRU lookups that hit, since the worker started."),
+    'reporoast_memory_cache_misses': ('gauge', "In-process LRU lookups that missed, since the worker started."),
+    'reporoast_memory_cache_evictions': ('gauge', "Entries evicted from the in-process LRU, since the worker started.")
+}
+_SAMPLED = {f'reporoast_memory_cache_{stat}': stat
+            for stat in ('entries', 'bytes', 'max_bytes', 'hits', 'misses', 'evictions')}
+
+def _labels(labels):
+    return ','.join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+
+class Metrics:
+    """
+    This process's counters, stage histograms and peak gauges. Values are keyed by
+    their rendered label string (e.g. 'stage="ai"') so snapshots are plain JSON.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {'counter': {}, 'histogram': {}, 'gauge': {}}
+
+    def inc(self, name, amount=1, **labels):
+        with self._lock:
+            series = self._data['counter'].setdefault(name, {})
+            key = _labels(labels)
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            series = self._data['histogram'].setdefault(name, {})
+            hist = series.setdefault(_labels(labels), {'buckets': [0] * len(STAGE_BUCKETS), 'sum': 0.0, 'count': 0})
+            for i, bound in enumerate(STAGE_BUCKETS):
+                if value <= bound:
+                    hist['buckets'][i] += 1
+            hist['sum'] += value
+            hist['count'] += 1
+
+    def set_max(self, name, value, **labels):
+        with self._lock:
+            series = self._data['gauge'].setdefault(name, {})
+            key = _labels(labels)
+            series[key] = max(series.get(key, 0), value)
+
+    def snapshot(self):
+        with self._lock:
+            data = json.loads(json.dumps(self._data))
+        stats = memory_cache.stats()
+        data['sampled'] = {name: {'': stats[stat]} for name, stat in _SAMPLED.items()}
+        return data
+
+    def flush(self):
+        """Writes this process's snapshot for other workers' /metrics to merge."""
+        try:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            with atomic_write(os.path.join(METRICS_DIR, f"{os.getpid()}.json"), 'w',
+                              durable=False, encoding='utf-8') as f:
+                json.dump(self.snapshot(), f)
+        except Exception as e:
+            print(f"Failed to write metrics snapshot: {e}")
+
+metrics = Metrics()
+
+def _merge(total, snapshot):
+    for name, series in snapshot.get('counter', {}).items():
+        merged = total['counter'].setdefault(name, {})
+        for key, value in series.items():
+            merged[key] = merged.get(key, 0) + value
+    for name, series in snapshot.get('histogram', {}).items():
+        merged = total['histogram'].setdefault(name, {})
+        for key, hist in series.items():
+            if key not in merged:
+                merged[key] = {'buckets': [0] * len(STAGE_BUCKETS), 'sum': 0.0, 'count': 0}
+            merged[key]['buckets'] = [a + b for a, b in zip(merged[key]['buckets'], hist['buckets'])]
+            merged[key]['sum'] += hist['sum']
+            merged[key]['count'] += hist['count']
+    for name, series in snapshot.get('gauge', {}).items():
+        merged = total['gauge'].setdefault(name, {})
+        for key, value in series.items():
+            merged[key] = max(merged.get(key, 0), value)
+    for name, series in snapshot.get('sampled', {}).items():
+        merged = total['sampled'].setdefault(name, {})
+        for key, value in series.items():
+            merged[key] = merged.get(key, 0) + value
+
+def collect():
+    """Every worker's metrics merged: counters, histograms and memory_cache stats summed, peaks maxed."""
+    metrics.flush()
+    total = {'counter': {}, 'histogram': {}, 'gauge': {}, 'sampled': {}}
+    cutoff = time.time() - METRICS_RETENTION_SECONDS
+    try:
+        names = os.listdir(METRICS_DIR)
+    except OSError:
+        names = []
+    for name in names:
+        path = os.path.join(METRICS_DIR, name)
+        if not name.endswith('.json'):
+            continue
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                _merge(total, json.load(f))
+        except (OSError, ValueError):
+            continue  # Being replaced or removed by its worker
+    return total
+
+def render_prometheus(data=None):
+    """Prometheus text exposition format (0.0.4) of collect()."""
+    data = collect() if data is None else data
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        series = data['sampled' if name in _SAMPLED else kind].get(name)
+        if not series:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for key, value in sorted(series.items()):
+            if kind != 'histogram':
+                lines.append(f"{name}{{{key}}} {value}" if key else f"{name} {value}")
+                continue
+            prefix = f"{key}," if key else ""
+            for bound, count in zip(STAGE_BUCKETS, value['buckets']):
+                lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {value["count"]}')
+            suffix = f"{{{key}}}" if key else ""
+            lines.append(f"{name}_sum{suffix} {value['sum']}")
+            lines.append(f"{name}_count{suffix} {value['count']}")
+    return "\n".join(lines) + "\n"
+
+def current_rss():
+    """Resident set size of this process in bytes, or None if it can't be read."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is None:
+        return None
+    # No /proc (macOS): lifetime peak instead, reported in bytes there
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+class MemorySampler:
+    """
+    One daemon thread per process that samples RSS every MEMORY_SAMPLE_SECONDS while
+    any stage is running, keeping each running stage's peak. Stages running
+    concurrently in other threads share the process, so their peaks overlap.
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._active = {}  # token -> peak bytes
+        self._next_token = 0
+        self._thread = None
+
+    def start(self):
+        rss = current_rss()
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='memory-sampler', daemon=True)
+                self._thread.start()
+            self._next_token += 1
+            self._active[self._next_token] = rss or 0
+            self._cond.notify()
+            return self._next_token
+
+    def stop(self, token):
+        rss = current_rss() or 0
+        with self._cond:
+            return max(self._active.pop(token, 0), rss) or None
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._active:
+                    self._cond.wait()
+            rss = current_rss()
+            if rss is None:
+                return  # Nothing to sample on this platform
+            with self._cond:
+                for token, peak in self._active.items():
+                    if rss > peak:
+                        self._active[token] = rss
+            time.sleep(MEMORY_SAMPLE_SECONDS)
+
+memory_sampler = MemorySampler()
+
+_local = threading.local()
+
+class JobTrace:
+    """
+    Per-job record of stage timings and notes, logged as one JSON line when the job
+    ends. Bound to the thread running the pipeline while used as a context manager.
+    """
+    def __init__(self, job_id, repo_url):
+        self.job_id = job_id
+        self.repo_url = repo_url
+        self.status = None
+        self.stages = {}  # name -> {'seconds', 'peak_rss_bytes', 'calls'}
+        self.notes = {}
+        self._started = time.time()
+
+    def add_stage(self, name, seconds, peak_rss=None):
+        entry = self.stages.setdefault(name, {'seconds': 0.0, 'peak_rss_bytes': None, 'calls': 0})
+        entry['seconds'] = round(entry['seconds'] + seconds, 4)
+        entry['calls'] += 1
+        if peak_rss and (entry['peak_rss_bytes'] or 0) < peak_rss:
+            entry['peak_rss_bytes'] = peak_rss
+
+    def __enter__(self):
+        _local.trace = self
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _local.trace = None
+        status = self.status or ('error' if exc_type else 'done')
+        metrics.inc('reporoast_jobs_total', status=status)
+        print(json.dumps({
+            'event': 'roast_job',
+            'job_id': self.job_id,
+            'repo_url': self.repo_url,
+            'status': status,
+            'total_seconds': round(time.time() - self._started, 3),
+            'stages': self.stages,
+            **self.notes
+        }, sort_keys=True))
+        metrics.flush()
+        return False
+
+def current_trace():
+    return getattr(_local, 'trace', None)
+
+def note(key, value):
+    """Adds a field to the current job's log record (no-op outside a job)."""
+    trace = current_trace()
+    if trace is not None:
+        trace.notes[key] = value
+
+def record_stage(name, seconds, peak_rss=None):
+    metrics.observe('reporoast_stage_seconds', seconds, stage=name)
+    if peak_rss:
+        metrics.set_max('reporoast_stage_peak_rss_bytes', peak_rss, stage=name)
+    trace = current_trace()
+    if trace is not None:
+        trace.add_stage(name, seconds, peak_rss)
+
+@contextmanager
+def stage(name):
+    """Times the block and samples peak RSS while it runs, as pipeline stage `name`."""
+    token = memory_sampler.start()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started, memory_sampler.stop(token))
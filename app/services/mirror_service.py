@@ -0,0 +1,146 @@
+import os
+import shutil
+import hashlib
+import tarfile
+import tempfile
+import uuid
+from contextlib import contextmanager
+from git import Repo
+from app.services.guardrail_service import CACHE_DIR, process_lock
+
+# Bare, shallow mirrors of repos we have roasted, reused across requests and workers
+MIRROR_DIR = os.path.join(CACHE_DIR, 'mirrors')
+MIRROR_CACHE_ENABLED = os.getenv('ROAST_MIRROR_CACHE', '1') not in ('0', 'false', 'False', '')
+MIRROR_MAX_BYTES = int(os.getenv('ROAST_MIRROR_MAX_BYTES', str(2 * 1024 ** 3)))  # 2GB total
+
+def ensure_mirror_dir():
+    if not os.path.exists(MIRROR_DIR):
+        os.makedirs(MIRROR_DIR)
+
+def mirror_key(repo_url):
+    """Stable directory name for a repo URL."""
+    url = repo_url.strip().rstrip('/')
+    if url.endswith('.git'):
+        url = url[:-4]
+    return hashlib.sha256(url.lower().encode()).hexdigest()[:32]
+
+def _lock_name(key):
+    return f"mirror_{key}"
+
+def sync_mirror(repo_url):
+    """
+    Creates or incrementally updates the mirror for repo_url.
+    Returns (mirror_path, commit_hash, default_branch).
+    """
+    ensure_mirror_dir()
+    key = mirror_key(repo_url)
+    mirror_path = os.path.join(MIRROR_DIR, f"{key}.git")
+
+    with process_lock(_lock_name(key)):
+        if os.path.isdir(mirror_path):
+            repo = Repo(mirror_path)
+            # Only the new objects for the current default-branch tip come over the wire
+            # URL validated at /ignite; '--' keeps it from ever being read as an option
+            repo.git.fetch('--depth=1', '--no-tags', '--', repo_url, 'HEAD')
+            commit_hash = repo.git.rev_parse('FETCH_HEAD')
+            repo.git.update_ref('HEAD', commit_hash)
+            repo.git.gc('--auto', '--quiet')
+        else:
+            tmp_path = os.path.join(MIRROR_DIR, f".{key}.{uuid.uuid4().hex}.tmp")
+            try:
+                Repo.clone_from(repo_url, tmp_path, bare=True, depth=1, no_tags=True)
+                os.rename(tmp_path, mirror_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    shutil.rmtree(tmp_path, ignore_errors=True)
+            repo = Repo(mirror_path)
+            commit_hash = repo.head.commit.hexsha
+        default_branch = repo.git.symbolic_ref('--short', 'HEAD')
+        # Directory mtime doubles as the LRU "last used" timestamp
+        os.utime(mirror_path)
+
+    evict_mirrors(keep=mirror_path)
+    return mirror_path, commit_hash, default_branch
+
+@contextmanager
+def open_mirror(repo_url):
+    """
+    Syncs the mirror and yields (repo, commit_hash, default_branch) while holding a
+    shared lock, so eviction can't delete the mirror while the caller reads objects.
+    """
+    key = mirror_key(repo_url)
+    for _ in range(2):
+        mirror_path, commit_hash, default_branch = sync_mirror(repo_url)
+        with process_lock(_lock_name(key), shared=True):
+            if not os.path.isdir(mirror_path):
+                continue  # Evicted between sync and read; sync again
+            yield Repo(mirror_path), commit_hash, default_branch
+            return
+    raise RuntimeError(f"Mirror for {repo_url} was evicted while in use")
+
+def checkout_from_mirror(repo_url, dest_path):
+    """
+    Syncs the mirror and materializes its HEAD tree into dest_path via `git archive`
+    (read-only on the mirror, so concurrent requests never fight over an index).
+    Returns (commit_hash, default_branch).
+    """
+    os.makedirs(dest_path, exist_ok=True)
+    with open_mirror(repo_url) as (repo, commit_hash, default_branch):
+        _archive_into(repo, commit_hash, dest_path)
+    return commit_hash, default_branch
+
+def _archive_into(repo, commit_hash, dest_path):
+    with tempfile.TemporaryFile() as archive:
+        repo.archive(archive, commit_hash, format='tar')
+        archive.seek(0)
+        with tarfile.open(fileobj=archive, mode='r:') as tar:
+            if hasattr(tarfile, 'data_filter'):
+                tar.extractall(dest_path, filter='data')
+            else:
+                tar.extractall(dest_path)
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def mirror_usage():
+    """Returns [(mirror_path, size_bytes, last_used)] for every mirror, least recently used first."""
+    if not os.path.isdir(MIRROR_DIR):
+        return []
+    usage = []
+    for name in os.listdir(MIRROR_DIR):
+        path = os.path.join(MIRROR_DIR, name)
+        if not name.endswith('.git') or not os.path.isdir(path):
+            continue
+        try:
+            usage.append((path, _dir_size(path), os.path.getmtime(path)))
+        except OSError:
+            continue
+    usage.sort(key=lambda item: item[2])
+    return usage
+
+def evict_mirrors(max_bytes=None, keep=None):
+    """Deletes least recently used mirrors (except `keep`) until the store fits in max_bytes."""
+    max_bytes = MIRROR_MAX_BYTES if max_bytes is None else max_bytes
+    usage = mirror_usage()
+    total = sum(size for _, size, _ in usage)
+    for path, size, _ in usage:
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        key = os.path.basename(path)[:-len('.git')]
+        # Skip mirrors that are being fetched or read right now
+        with process_lock(_lock_name(key), blocking=False) as acquired:
+            if not acquired:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            print(f"Evicted mirror {key} ({size} bytes)")
+    return total
@@ -0,0 +1,204 @@
+import os
+import time
+import itertools
+from contextlib import ExitStack
+from app.services.github_service import open_ingest_stream, resolve_remote_head
+from app.services.classifier_service import FileCategory, classify_record
+from app.services.blueprint_service import extract_interface
+from app.services.graph_service import ImportGraph
+from app.services.dedup_service import DuplicateDetector
+from app.services.metrics_service import metrics, note, record_stage, stage
+from app.services.guardrail_service import (
+    CACHE_TTL_SECONDS, SnapshotWriter, get_repo_hash, get_cached_result, save_result,
+    estimate_and_prune, has_repo_data, single_flight
+)
+from app.services.ai_service import AIService
+from app.services.tts_service import TTSService
+
+ai_service = AIService()
+tts_service = TTSService()
+
+# File content kept in memory for the blueprint (chars, ~bytes for source code). Past
+# this, FULL_CODE files are reduced to their interface as they stream in.
+INGEST_MEMORY_BUDGET_BYTES = int(os.getenv('ROAST_INGEST_MEMORY_BUDGET_BYTES', str(64 * 1024 * 1024)))
+
+class PipelineError(Exception):
+    """A pipeline failure with the HTTP status the client should see."""
+    def __init__(self, message, status=500):
+        super().__init__(message)
+        self.status = status
+
+def _noop_report(stage, message):
+    pass
+
+def lookup_cached_roast(repo_url):
+    """
+    Pre-flight before any clone: resolves the remote HEAD commit (ls-remote) and
+    returns the repo hash if a fresh roast and code-viewer snapshot already exist.
+    Returns None on a miss or if the remote can't be resolved.
+    """
+    if CACHE_TTL_SECONDS <= 0:
+        return None
+    try:
+        commit_hash, _ = resolve_remote_head(repo_url)
+    except Exception as e:
+        print(f"Pre-flight ls-remote failed for {repo_url}: {e}")
+        return None
+    repo_hash = get_repo_hash(repo_url, commit_hash)
+    if has_repo_data(repo_hash) and get_cached_result(repo_hash, max_age=CACHE_TTL_SECONDS):
+        return repo_hash
+    return None
+
+def run_roast_pipeline(repo_url, report=_noop_report, force_refresh=False):
+    """
+    Clone -> classify -> prune -> Gemini -> TTS.
+    Calls report(stage, message) as each stage starts and returns the repo hash.
+    A fresh cached roast for the same commit is reused unless force_refresh is set.
+    """
+    # 1. Fetch (file records are streamed later, once we know they're needed)
+    report('ingest', "Cloning repo (hoping it compiles)...")
+    print(f"Ingesting {repo_url}...")
+    for attempt in itertools.count():
+        with ExitStack() as stack:
+            try:
+                with stage('clone'):
+                    stream = stack.enter_context(open_ingest_stream(repo_url))
+            except Exception as e:
+                raise PipelineError(f"Failed to ingest repo: {str(e)}", 400)
+
+            # 2. Hash (the commit is known before any file is read)
+            repo_hash = get_repo_hash(repo_url, stream.meta.get('commit_hash', 'unknown'))
+            if has_repo_data(repo_hash) and _fresh_result(repo_hash, report, force_refresh):
+                return repo_hash
+
+            # 3. Everything after this point is keyed by repo_hash: concurrent roasts of the
+            # same commit (in any worker) wait for the first one, with their git resources
+            # released, and reuse its result
+            released = []
+
+            def release():
+                stack.close()
+                released.append(True)
+
+            def run():
+                # Re-checked under the lock, another worker may have just finished
+                if has_repo_data(repo_hash) and _fresh_result(repo_hash, report, force_refresh):
+                    return repo_hash
+                if released:
+                    return None  # It failed: open the repo again and roast it here
+                # Stream files: snapshot for the code viewer, classify, slim. Everything later
+                # stages need is in memory afterwards, so the git resources (mirror lock, temp
+                # clone) are released here rather than held through the Gemini + TTS run
+                print("Reading, classifying and pruning...")
+                repo_structure = _ingest(repo_hash, stream)
+                release()
+                return _roast(repo_hash, repo_structure, report)
+
+            # On a retry the repo stays open while waiting, so this caller ends up roasting
+            result = single_flight.do(repo_hash, run, on_wait=release if attempt == 0 else None)
+        if result is not None:
+            return result
+
+def _fresh_result(repo_hash, report, force_refresh):
+    """True if a fresh roast of this commit is cached (reported as a cache hit)."""
+    if force_refresh or CACHE_TTL_SECONDS <= 0:
+        return False
+    if not get_cached_result(repo_hash, max_age=CACHE_TTL_SECONDS):
+        return False
+    print("Cache hit! Serving pre-roasted content.")
+    metrics.inc('reporoast_cache_hits_total', layer='pipeline')
+    note('cache_hit', True)
+    report('ai', "Found a fresh roast for this commit, skipping the AI call.")
+    return True
+
+def _slim_for_blueprint(file_record, retained_bytes):
+    """
+    Drops whatever the blueprint won't need from a classified record.
+    Returns the number of content chars kept in memory.
+    """
+    content = file_record.get('content', '')
+    category = file_record['category']
+    if category == FileCategory.IGNORE:
+        # Only the path is used (tree listing)
+        file_record['content'] = ''
+        return 0
+    if category == FileCategory.FULL_CODE and retained_bytes + len(content) <= INGEST_MEMORY_BUDGET_BYTES:
+        return len(content)
+    # INTERFACE_ONLY, or FULL_CODE past the memory budget: keep only the summary
+    file_record['category'] = FileCategory.INTERFACE_ONLY
+    file_record['interface'] = extract_interface(content, file_record.get('language', 'Unknown'), file_record.get('blob'))
+    del file_record['content']
+    return 0
+
+def _ingest(repo_hash, stream):
+    """
+    Consumes the ingest stream once: each record gets classified, goes to the
+    code-viewer snapshot on disk (full content), is checked for generated, vendored
+    and duplicated content, has its imports noted, and is slimmed for the blueprint.
+    Records are ranked by import centrality and near-duplicates collapsed at the end.
+    """
+    repo_structure = stream.to_structure([])
+    retained_bytes = 0
+    graph = ImportGraph()
+    dedup = DuplicateDetector()
+    classify_seconds = 0.0  # Classification runs interleaved with reading; timed separately
+    try:
+        with stage('ingest'), SnapshotWriter(repo_hash, stream.url, stream.meta) as snapshot:
+            for file_record in stream:
+                started = time.perf_counter()
+                classify_record(file_record)
+                classify_seconds += time.perf_counter() - started
+                snapshot.add(file_record)
+                started = time.perf_counter()
+                if file_record['category'] != FileCategory.IGNORE and not dedup.add(file_record):
+                    graph.add(file_record)
+                classify_seconds += time.perf_counter() - started
+                retained_bytes += _slim_for_blueprint(file_record, retained_bytes)
+                repo_structure['files'].append(file_record)
+            snapshot.stats = stream.stats
+    except Exception as e:
+        raise PipelineError(f"Failed to ingest repo: {str(e)}", 400)
+    started = time.perf_counter()
+    edge_count = graph.rank(repo_structure['files'])
+    print(f"Import graph: {len(graph.imports)} importing files, {edge_count} in-repo edges.")
+    dedup.collapse()
+    print(f"Redundant files dropped from the blueprint: {dedup.counts}")
+    record_stage('classify', classify_seconds + time.perf_counter() - started)
+    note('files', repo_structure['stats'].get('file_count', 0))
+    note('redundant_files', dedup.counts)
+    return repo_structure
+
+def _roast(repo_hash, repo_structure, report):
+    stats = repo_structure['stats']
+    skipped = repo_structure['meta'].get('skipped')
+    if skipped:
+        print(f"Ingestion budget hit, skipped: {skipped}")
+        report('ingest', f"Repo is huge; read the most important {stats.get('file_count', 0)} files and skipped "
+                         f"{skipped['total_bytes'] + skipped['max_files'] + skipped['deadline']}.")
+    report('classify', f"Sorted {stats.get('file_count', 0)} files into keep / skim / ignore...")
+    report('blueprint', "Building the repository blueprint...")
+    with stage('blueprint'):
+        blueprint = estimate_and_prune(repo_structure)
+    blueprint_bytes = len(blueprint.encode('utf-8'))
+    metrics.inc('reporoast_blueprint_bytes_total', blueprint_bytes)
+    note('blueprint_bytes', blueprint_bytes)
+
+    # 5. AI Analysis
+    report('ai', "Judging your architecture (this is the slow part)...")
+    print("Calling Gemini...")
+    with stage('ai'):
+        analysis = ai_service.analyze_repo(blueprint)
+    if "error" in analysis:
+        raise PipelineError(analysis['error'], 500)
+
+    # 6. Audio Generation
+    report('audio', "Synthesizing disappointment...")
+    print("Synthesizing audio...")
+    with stage('audio'):
+        audio_path = tts_service.generate_roast_audio(analysis.get('roast_dialogue', []), repo_hash)
+    analysis['audio_path'] = audio_path
+
+    # 7. Save Result
+    save_result(repo_hash, analysis)
+
+    return repo_hash
@@ -0,0 +1,138 @@
+import os
+import heapq
+import itertools
+import math
+import threading
+import time
+
+# Priority levels (lower runs first). Cache hits never reach the scheduler:
+# /ignite answers them from the pre-flight lookup.
+PRIORITY_NORMAL = 10
+
+# Initial guess for a full clone -> Gemini -> TTS run, refined as jobs finish
+DEFAULT_JOB_SECONDS = 60.0
+EWMA_ALPHA = 0.3
+
+
+def _env_int(name, default):
+    try:
+        return max(1, int(os.getenv(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+def default_max_concurrent():
+    """
+    Pipelines admitted per process. Pipelines run on the scheduler's own threads
+    (not gunicorn's), so this defaults to the gunicorn thread count per worker.
+    """
+    return _env_int('ROAST_MAX_CONCURRENT', _env_int('GUNICORN_THREADS', 4))
+
+
+def default_max_queue():
+    return _env_int('ROAST_MAX_QUEUE', 16)
+
+
+class SchedulerBusy(Exception):
+    """Raised when the backlog is full. Carries enough info for a Retry-After answer."""
+    def __init__(self, queue_depth, eta_seconds):
+        super().__init__("Roast queue is full")
+        self.queue_depth = queue_depth
+        self.eta_seconds = eta_seconds
+
+
+class ScheduledJob:
+    """A unit of work waiting for (or holding) one of the scheduler's slots."""
+    def __init__(self, fn, args, kwargs, priority, seq):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.seq = seq
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self._done = threading.Event()
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+
+class JobScheduler:
+    """
+    Admits up to `max_concurrent` pipelines at once and keeps at most `max_queue`
+    waiting in a FIFO queue.
+    Worker threads are started lazily so they are created after gunicorn forks.
+    """
+    def __init__(self, max_concurrent=None, max_queue=None):
+        self.max_concurrent = max_concurrent or default_max_concurrent()
+        self.max_queue = max_queue or default_max_queue()
+        self._queue = []
+        self._running = set()
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._workers = []
+        self._avg_seconds = DEFAULT_JOB_SECONDS
+
+    def _ensure_workers(self):
+        while len(self._workers) < self.max_concurrent:
+            t = threading.Thread(target=self._worker_loop, name=f"roast-worker-{len(self._workers)}", daemon=True)
+            self._workers.append(t)
+            t.start()
+
+    def submit(self, fn, *args, priority=PRIORITY_NORMAL, **kwargs):
+        """Queues `fn(*args, **kwargs)`. Raises SchedulerBusy if the backlog is full."""
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                raise SchedulerBusy(len(self._queue), self._eta_for_position(len(self._queue) + 1))
+            job = ScheduledJob(fn, args, kwargs, priority, next(self._seq))
+            heapq.heappush(self._queue, job)
+            self._ensure_workers()
+            self._cond.notify()
+            return job
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                job = heapq.heappop(self._queue)
+                self._running.add(job)
+            job.started_at = time.time()
+            try:
+                job.result = job.fn(*job.args, **job.kwargs)
+            except Exception as e:
+                job.error = e
+            finally:
+                job.finished_at = time.time()
+                with self._cond:
+                    self._running.discard(job)
+                    elapsed = job.finished_at - job.started_at
+                    self._avg_seconds = (1 - EWMA_ALPHA) * self._avg_seconds + EWMA_ALPHA * elapsed
+                job._done.set()
+
+    def position(self, job):
+        """1-based position in the wait queue, or 0 once the job is running/finished."""
+        with self._cond:
+            if job not in self._queue:
+                return 0
+            return sum(1 for other in self._queue if other < job) + 1
+
+    def _eta_for_position(self, position):
+        if position <= 0:
+            return 0
+        # Every `max_concurrent` jobs ahead of us cost one average pipeline run
+        return int(math.ceil(position / self.max_concurrent) * self._avg_seconds)
+
+    def eta(self, job):
+        """Rough seconds until the job gets a slot."""
+        return self._eta_for_position(self.position(job))
@@ -0,0 +1,148 @@
+import os
+import gzip
+import json
+import struct
+import threading
+from contextlib import contextmanager
+try:
+    import msgpack  # Optional: binary encoding, faster and smaller than JSON
+except ImportError:
+    msgpack = None
+try:
+    import zstandard  # Optional: better ratio/speed than gzip
+except ImportError:
+    zstandard = None
+
+# Cache files start with a 6 byte header: magic, format version, codec, compression.
+# Files without it (the old pretty-printed JSON) are read as plain JSON.
+CACHE_MAGIC = b'RRC'
+CACHE_FORMAT_VERSION = 1
+CACHE_HEADER = struct.Struct('<3sBBB')
+
+CODECS = {'json': 1, 'msgpack': 2}
+COMPRESSIONS = {'none': 0, 'gzip': 1, 'zstd': 2}
+_CODEC_NAMES = {v: k for k, v in CODECS.items()}
+_COMPRESSION_NAMES = {v: k for k, v in COMPRESSIONS.items()}
+
+class CacheFormatError(ValueError):
+    """Raised for cache files written with an unknown version, codec or compression."""
+
+@contextmanager
+def atomic_write(path, mode='wb', durable=True, **open_kwargs):
+    """
+    Yields a file handle on a temp file next to `path`. On a clean exit the data is
+    renamed over `path`, so readers (in any process) see either the old file or the
+    complete new one, never a partial write. With durable, the data and the rename
+    are fsynced first so this also holds after a crash.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, mode, **open_kwargs) as f:
+            yield f
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        if durable:
+            _fsync_dir(os.path.dirname(path))
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _fsync_dir(path):
+    # Makes the rename itself durable; not supported on every platform
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def available(codec, compression):
+    """True if this process can read and write the given combination."""
+    if codec not in CODECS or compression not in COMPRESSIONS:
+        return False
+    if codec == 'msgpack' and msgpack is None:
+        return False
+    if compression == 'zstd' and zstandard is None:
+        return False
+    return True
+
+class CacheSerializer:
+    """
+    Encodes cache objects (results, snapshot manifests) as header + payload.
+    Reading dispatches on the header, so any combination written earlier (or the
+    legacy header-less JSON) stays readable after the configured format changes.
+    """
+    def __init__(self, codec='json', compression='none', level=None):
+        if not available(codec, compression):
+            raise CacheFormatError(f"Cache format {codec}/{compression} is not available")
+        self.codec = codec
+        self.compression = compression
+        self.level = level
+        self._local = threading.local()  # zstd contexts are not thread-safe
+
+    def _encode(self, obj):
+        if self.codec == 'msgpack':
+            return msgpack.packb(obj, use_bin_type=True)
+        return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+    def _compress(self, payload):
+        if self.compression == 'gzip':
+            return gzip.compress(payload, compresslevel=self.level or 6)
+        if self.compression == 'zstd':
+            compressor = getattr(self._local, 'compressor', None)
+            if compressor is None:
+                compressor = self._local.compressor = zstandard.ZstdCompressor(level=self.level or 3)
+            return compressor.compress(payload)
+        return payload
+
+    def dumps(self, obj):
+        header = CACHE_HEADER.pack(CACHE_MAGIC, CACHE_FORMAT_VERSION, CODECS[self.codec], COMPRESSIONS[self.compression])
+        return header + self._compress(self._encode(obj))
+
+    def loads(self, data):
+        return self.decode(data)[0]
+
+    def decode(self, data):
+        """Returns (obj, decoded payload size); objects take a few times that in memory."""
+        if not data.startswith(CACHE_MAGIC):
+            return json.loads(data), len(data)
+        _, version, codec_id, compression_id = CACHE_HEADER.unpack_from(data, 0)
+        codec = _CODEC_NAMES.get(codec_id)
+        compression = _COMPRESSION_NAMES.get(compression_id)
+        if version != CACHE_FORMAT_VERSION or not available(codec, compression):
+            raise CacheFormatError(f"Unreadable cache format v{version} codec={codec_id} compression={compression_id}")
+        payload = memoryview(data)[CACHE_HEADER.size:]
+        if compression == 'gzip':
+            payload = gzip.decompress(payload)
+        elif compression == 'zstd':
+            payload = zstandard.ZstdDecompressor().decompress(payload)
+        if codec == 'msgpack':
+            return msgpack.unpackb(payload, raw=False), len(payload)
+        return json.loads(bytes(payload)), len(payload)
+
+    def dump_file(self, obj, path):
+        """Writes obj to path atomically (see atomic_write)."""
+        data = self.dumps(obj)
+        with atomic_write(path) as f:
+            f.write(data)
+
+    def load_file(self, path):
+        with open(path, 'rb') as f:
+            return self.decode(f.read())
+
+def default_serializer():
+    """Serializer from ROAST_CACHE_CODEC / ROAST_CACHE_COMPRESSION, falling back to compact JSON."""
+    codec = os.getenv('ROAST_CACHE_CODEC', 'json')
+    compression = os.getenv('ROAST_CACHE_COMPRESSION', 'none')
+    if not available(codec, compression):
+        print(f"Cache format {codec}/{compression} unavailable (missing package?), using json/none")
+        codec, compression = 'json', 'none'
+    return CacheSerializer(codec, compression)
+
+cache_serializer = default_serializer()
@@ -0,0 +1,153 @@
+import os
+import shutil
+import threading
+import time
+from abc import ABC, abstractmethod
+from app.services.serializer_service import atomic_write
+try:
+    from google.cloud import storage as gcs  # Optional: only needed for gs:// shared stores
+    from google.api_core.exceptions import NotFound, PreconditionFailed
+except ImportError:
+    gcs = None
+
+# Shared object store behind the local cache dirs, so every instance (e.g. on Cloud Run)
+# sees every roast: '' (local disk only), 'gs://bucket/prefix', 'file:///shared/dir' or 'memory'
+SHARED_STORE_URL = os.getenv('ROAST_SHARED_STORE', '')
+
+class ObjectStore(ABC):
+    """
+    Key -> bytes store shared between instances. Local disk stays the working copy
+    (path index mmap, file locks and memory cache validators need real files): cache
+    files are fetched into it on a local miss and published after they are written.
+    Keys look like 'cache/<hash>.json' or 'generated/roast_<id>.mp3'.
+    """
+    @abstractmethod
+    def fetch(self, key, dest_path):
+        """Downloads key to dest_path (atomically, keeping the stored mtime). Returns False if missing."""
+
+    @abstractmethod
+    def upload(self, key, src_path, if_absent=False):
+        """Uploads a local file. With if_absent, an existing object is left alone (immutable content)."""
+
+class FilesystemStore(ObjectStore):
+    """A directory used as the object store: a shared volume (NFS, Filestore) or a local stand-in for tests."""
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f"Invalid store key {key}")
+        return path
+
+    def fetch(self, key, dest_path):
+        src = self._path(key)
+        try:
+            with open(src, 'rb') as f_in:
+                mtime = os.fstat(f_in.fileno()).st_mtime
+                os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+                with atomic_write(dest_path, durable=False) as f_out:
+                    shutil.copyfileobj(f_in, f_out)
+        except FileNotFoundError:
+            return False
+        os.utime(dest_path, (mtime, mtime))
+        return True
+
+    def upload(self, key, src_path, if_absent=False):
+        dest = self._path(key)
+        if if_absent and os.path.exists(dest):
+            return
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        with open(src_path, 'rb') as f_in, atomic_write(dest) as f_out:
+            shutil.copyfileobj(f_in, f_out)
+
+class MemoryStore(ObjectStore):
+    """In-process fake of a shared store, for development and tests."""
+    def __init__(self):
+        self._objects = {}  # key -> (bytes, mtime)
+        self._lock = threading.Lock()
+
+    def fetch(self, key, dest_path):
+        with self._lock:
+            item = self._objects.get(key)
+        if item is None:
+            return False
+        data, mtime = item
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        with atomic_write(dest_path, durable=False) as f:
+            f.write(data)
+        os.utime(dest_path, (mtime, mtime))
+        return True
+
+    def upload(self, key, src_path, if_absent=False):
+        with open(src_path, 'rb') as f:
+            data = f.read()
+        with self._lock:
+            if if_absent and key in self._objects:
+                return
+            self._objects[key] = (data, time.time())
+
+class GCSStore(ObjectStore):
+    """Google Cloud Storage bucket (needs google-cloud-storage). Use bucket lifecycle rules for expiry."""
+    def __init__(self, bucket, prefix=''):
+        if gcs is None:
+            raise RuntimeError("gs:// shared store needs the google-cloud-storage package")
+        self.bucket = gcs.Client().bucket(bucket)
+        self.prefix = prefix.strip('/')
+
+    def _name(self, key):
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def fetch(self, key, dest_path):
+        blob = self.bucket.get_blob(self._name(key))
+        if blob is None:
+            return False
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        try:
+            with atomic_write(dest_path, durable=False) as f:
+                blob.download_to_file(f)
+        except NotFound:
+            return False  # Deleted between the lookup and the download
+        mtime = blob.updated.timestamp() if blob.updated else time.time()
+        os.utime(dest_path, (mtime, mtime))
+        return True
+
+    def upload(self, key, src_path, if_absent=False):
+        blob = self.bucket.blob(self._name(key))
+        try:
+            blob.upload_from_filename(src_path, if_generation_match=0 if if_absent else None)
+        except PreconditionFailed:
+            pass  # Already there; content-addressed objects never change
+
+def open_store(url):
+    """ObjectStore for a ROAST_SHARED_STORE url, or None for local disk only."""
+    if not url:
+        return None
+    if url == 'memory':
+        return MemoryStore()
+    if url.startswith('file://'):
+        return FilesystemStore(url[len('file://'):])
+    if url.startswith('gs://'):
+        bucket, _, prefix = url[len('gs://'):].partition('/')
+        return GCSStore(bucket, prefix)
+    raise ValueError(f"Unsupported ROAST_SHARED_STORE {url}")
+
+shared_store = open_store(SHARED_STORE_URL)
+
+def ensure_local(path, key):
+    """True if path exists locally, fetching it from the shared store on a local miss."""
+    if os.path.exists(path):
+        return True
+    if shared_store is None:
+        return False
+    try:
+        return shared_store.fetch(key, path)
+    except Exception as e:
+        print(f"Shared store fetch failed for {key}: {e}")
+        return False
+
+def publish(path, key, if_absent=False):
+    """Uploads a freshly written local file to the shared store (no-op for local disk only)."""
+    if shared_store is None:
+        return
+    shared_store.upload(key, path, if_absent=if_absent)
@@ -0,0 +1,49 @@
+import os
+import re
+import json
+import hashlib
+
+# Local prompt-size estimate, so budgeting doesn't need a count_tokens round trip per file.
+# Text is cut into the pieces a BPE tokenizer typically emits one token for: letter runs
+# (long identifiers split every 8 letters), digit groups, single symbols, newlines and
+# indentation runs. A single space before a word is merged into it, so it isn't counted.
+_TOKEN_PIECES = re.compile(r"[A-Za-z]{1,8}|\d{1,3}|[^\sA-Za-z\d]|\n|[ \t]{2,}")
+
+# pieces -> model tokens, per language. Defaults are overridden by token_calibration.json,
+# written by calibrate_tokens.py from real count_tokens answers.
+CALIBRATION_PATH = os.path.join(os.path.dirname(__file__), 'token_calibration.json')
+DEFAULT_TOKENS_PER_PIECE = {'default': 0.85}
+
+def _load_calibration():
+    factors = dict(DEFAULT_TOKENS_PER_PIECE)
+    try:
+        with open(CALIBRATION_PATH, 'r', encoding='utf-8') as f:
+            factors.update(json.load(f).get('tokens_per_piece', {}))
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"Ignoring token calibration file: {e}")
+    return factors
+
+TOKENS_PER_PIECE = _load_calibration()
+
+def count_pieces(text):
+    return len(_TOKEN_PIECES.findall(text))
+
+def estimate_tokens(text, language='default', digest=None):
+    """
+    Estimated model tokens for text. Memoized by content hash for texts worth caching;
+    `digest` is that hash if the caller has it (a file record's blob id).
+    """
+    factor = TOKENS_PER_PIECE.get(language, TOKENS_PER_PIECE['default'])
+    if len(text) < 256:
+        return int(count_pieces(text) * factor + 0.5)
+
+    from app.services.guardrail_service import memory_cache  # Import cycle: guardrail imports blueprint_service
+
+    key = ('pieces', digest or hashlib.sha1(text.encode('utf-8', 'surrogatepass')).hexdigest())
+    pieces = memory_cache.get(key)
+    if pieces is None:
+        pieces = count_pieces(text)
+        memory_cache.put(key, pieces, 64)
+    return int(pieces * factor + 0.5)
@@ -2,11 +2,19 @@
 
 import os
 import json
+import hashlib
 import tempfile
 from app.services.guardrail_service import ensure_cache_dir
+from app.services.metrics_service import stage
+from app.services.serializer_service import atomic_write
+from app.services.storage_service import ensure_local, publish
 
 # Ensure generated directory exists for frontend serving
-GENERATED_DIR = os.path.join(os.getcwd(), 'app', 'static', 'generated')
+GENERATED_DIR = os.getenv('ROAST_GENERATED_DIR') or os.path.join(os.getcwd(), 'app', 'static', 'generated')
+
+def generated_key(filename):
+    """Shared store key of a file in GENERATED_DIR."""
+    return f"generated/{filename}"
 
 def ensure_generated_dir():
     if not os.path.exists(GENERATED_DIR):
@@ -182,12 +190,14 @@ class TTSService:
         # Initialize client to determine if we can use Cloud TTS
         self._initialize_client()
         
-        output_filename = f"roast_{unique_id}.mp3"
+        # Audio is keyed by the dialogue itself, so a regenerated roast never reuses stale audio
+        dialogue_digest = hashlib.sha256(json.dumps(dialogue_list, sort_keys=True).encode()).hexdigest()[:16]
+        output_filename = f"roast_{unique_id}_{dialogue_digest}.mp3"
         output_path = os.path.join(GENERATED_DIR, output_filename)
         
-        # CACHING DISABLED: Always generate fresh audio
-        # if os.path.exists(output_path):
-        #     return f"generated/{output_filename}"
+        if ensure_local(output_path, generated_key(output_filename)) and os.path.getsize(output_path) > 0:
+            print(f"Reusing cached audio {output_filename}")
+            return f"generated/{output_filename}"
 
         combined_audio = b""
         print(f"Synthesizing {len(dialogue_list)} turns using {'Google Cloud' if self.use_google_cloud else 'gTTS'}...")
@@ -197,10 +207,11 @@ class TTSService:
             text = turn.get('text', '')
             if not text: continue
                 
-            if self.use_google_cloud:
-                chunk = self.synthesize_turn_cloud(text, speaker)
-            else:
-                chunk = self.synthesize_turn_gtts(text, speaker)
+            with stage('tts_turn'):
+                if self.use_google_cloud:
+                    chunk = self.synthesize_turn_cloud(text, speaker)
+                else:
+                    chunk = self.synthesize_turn_gtts(text, speaker)
                 
             if chunk:
                 combined_audio += chunk
@@ -214,8 +225,13 @@ class TTSService:
         if not combined_audio:
             return None
 
-        with open(output_path, "wb") as out:
+        # Write then rename, so a reused file is never a half-written one
+        with atomic_write(output_path) as out:
             out.write(combined_audio)
+        try:
+            publish(output_path, generated_key(output_filename))
+        except Exception as e:
+            print(f"Failed to publish audio to the shared store: {e}")
             
         return f"generated/{output_filename}"
 
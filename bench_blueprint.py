@@ -0,0 +1,74 @@
+import time
+import random
+from app.services.blueprint_service import generate_blueprint, generate_tree
+
+def make_repo(file_count=50000):
+    """Synthetic classified repo: mostly small files, some big ones, ~4M chars of blueprint."""
+    random.seed(0)
+    files = []
+    for i in range(file_count):
+        category = random.choice(['FULL_CODE', 'INTERFACE_ONLY', 'IGNORE'])
+        size = random.choice([20, 40, 80, 200, 2000])
+        files.append({
+            'path': f"src/pkg{i % 300}/module_{i}.py",
+            'language': 'Python',
+            'category': category,
+            'content': 'x = 1\n' * (size // 6),
+            'interface': 'def f():\n... (Implementation details omitted for Python file)'
+        })
+    return {'files': files}
+
+def legacy_generate_tree(files):
+    # The += version generate_tree used before
+    tree_str = "Repository Structure:\n"
+    for path in sorted([f['path'] for f in files]):
+        tree_str += f"- {path}\n"
+    return tree_str
+
+def legacy_generate_blueprint(repo_structure):
+    # The += version generate_blueprint used before
+    files = repo_structure['files']
+    blueprint = "=== REPOSITORY BLUEPRINT ===\n\n"
+    blueprint += legacy_generate_tree(files)
+    blueprint += "\n" + "="*30 + "\n\n"
+    for file in files:
+        category = file.get('category', 'INTERFACE_ONLY')
+        if category == 'IGNORE':
+            continue
+        blueprint += f"=== FILE: {file['path']} ({file.get('language', 'Unknown')}) ===\n"
+        blueprint += f"Category: {category}\n"
+        if category == 'FULL_CODE':
+            blueprint += file.get('content', '')
+        else:
+            blueprint += file['interface']
+        blueprint += "\n=== END FILE ===\n\n"
+    return blueprint
+
+def time_it(fn, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def bench():
+    repo = make_repo()
+    rows = []
+    for name, old, new in (
+        ('generate_tree', lambda: legacy_generate_tree(repo['files']), lambda: generate_tree(repo['files'])),
+        ('generate_blueprint', lambda: legacy_generate_blueprint(repo), lambda: generate_blueprint(repo)),
+    ):
+        old_s, old_out = time_it(old)
+        new_s, new_out = time_it(new)
+        assert old_out == new_out, f"{name} output changed"
+        rows.append((name, len(new_out), old_s, new_s))
+
+    print(f"\n{len(repo['files'])}-file synthetic repo (best of 5)")
+    print(f"{'function':<20}{'chars':>10}{'+= MB/s':>10}{'join MB/s':>11}{'speedup':>9}")
+    for name, chars, old_s, new_s in rows:
+        mb = chars / 1e6
+        print(f"{name:<20}{chars:>10}{mb / old_s:>10.0f}{mb / new_s:>11.0f}{old_s / new_s:>8.2f}x")
+
+if __name__ == "__main__":
+    bench()
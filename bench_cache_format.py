@@ -0,0 +1,72 @@
+import os
+import json
+import time
+import random
+import tempfile
+from app.services.serializer_service import CODECS, COMPRESSIONS, CacheSerializer, available
+
+def make_manifest(file_count=20000):
+    """Synthetic snapshot manifest shaped like SnapshotWriter output."""
+    random.seed(0)
+    languages = ['Python', 'JavaScript', 'TypeScript', 'Go', 'Markdown']
+    categories = ['FULL_CODE', 'INTERFACE_ONLY', 'IGNORE']
+    files = []
+    for i in range(file_count):
+        depth = random.randint(1, 6)
+        path = '/'.join(f"pkg{random.randint(0, 40)}" for _ in range(depth)) + f"/module_{i}.py"
+        files.append({
+            'path': path,
+            'lines': random.randint(1, 2000),
+            'language': random.choice(languages),
+            'category': random.choice(categories),
+            'blob': '%040x' % random.getrandbits(160)
+        })
+    return {'format': 'manifest-v1', 'url': 'https://github.com/example/big', 'files': files,
+            'meta': {'commit_hash': '%040x' % random.getrandbits(160), 'default_branch': 'main'},
+            'stats': {'file_count': file_count}}
+
+def time_it(fn, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def bench():
+    manifest = make_manifest()
+    tmp_dir = tempfile.mkdtemp()
+    path = os.path.join(tmp_dir, 'manifest')
+
+    rows = []
+    # Baseline: what save_result / save_repo_data used to write
+    def legacy_write():
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+    def legacy_read():
+        with open(path, 'r', encoding='utf-8') as f:
+            json.load(f)
+    write_s = time_it(legacy_write)
+    read_s = time_it(legacy_read)
+    rows.append(('json indent=2 (old)', write_s, read_s, os.path.getsize(path)))
+
+    for codec in CODECS:
+        for compression in COMPRESSIONS:
+            if not available(codec, compression):
+                print(f"Skipping {codec}/{compression} (package not installed)")
+                continue
+            serializer = CacheSerializer(codec, compression)
+            write_s = time_it(lambda: serializer.dump_file(manifest, path))
+            read_s = time_it(lambda: serializer.load_file(path))
+            rows.append((f"{codec}/{compression}", write_s, read_s, os.path.getsize(path)))
+
+    os.remove(path)
+    os.rmdir(tmp_dir)
+
+    print(f"\n{len(manifest['files'])}-file manifest (best of 5)")
+    print(f"{'format':<22}{'write ms':>10}{'read ms':>10}{'size KB':>10}")
+    for name, write_s, read_s, size in rows:
+        print(f"{name:<22}{write_s * 1000:>10.1f}{read_s * 1000:>10.1f}{size / 1024:>10.0f}")
+
+if __name__ == "__main__":
+    bench()
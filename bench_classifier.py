@@ -0,0 +1,54 @@
+import re
+import time
+import random
+from app.services.classifier_service import IGNORE_PATTERNS, FileCategory, classify_path, classify_paths
+
+def make_listing(path_count=100000):
+    """Synthetic 100k-path listing with a realistic share of tests, vendored and asset paths."""
+    random.seed(0)
+    dirs = ['src', 'lib', 'app', 'pkg', 'internal', 'cmd', 'api', 'core', 'services', 'components',
+            'tests', 'node_modules', 'assets', 'docs', 'scripts', 'utils', 'models', 'migrations']
+    exts = ['.py', '.js', '.ts', '.go', '.java', '.md', '.json', '.css', '.svg', '.d.ts', '.min.js']
+    paths = []
+    for i in range(path_count):
+        depth = random.randint(1, 6)
+        parts = [random.choice(dirs) for _ in range(depth)]
+        paths.append('/'.join(parts) + f"/file_{i}" + random.choice(exts))
+    return paths
+
+def legacy_classify_path(path):
+    # The any(re.search(...)) version classify_path used before
+    path_lower = path.lower()
+    if any(re.search(p, path_lower) for p in IGNORE_PATTERNS):
+        return FileCategory.IGNORE
+    if path_lower.endswith('.d.ts') or path_lower.endswith('.min.js'):
+        return FileCategory.INTERFACE_ONLY
+    return FileCategory.FULL_CODE
+
+def time_it(fn, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def bench():
+    paths = make_listing()
+    legacy_s, expected = time_it(lambda: [legacy_classify_path(p) for p in paths])
+    rows = [('any(re.search) per path (old)', legacy_s)]
+    for name, fn in (
+        ('combined regex per path', lambda: [classify_path(p) for p in paths]),
+        ('classify_paths batch', lambda: classify_paths(paths)),
+    ):
+        seconds, result = time_it(fn)
+        assert result == expected, f"{name} disagrees with the old classifier"
+        rows.append((name, seconds))
+
+    print(f"\n{len(paths)}-path listing (best of 3), {expected.count(FileCategory.IGNORE)} ignored")
+    print(f"{'method':<32}{'ms':>9}{'paths/s':>12}{'speedup':>9}")
+    for name, seconds in rows:
+        print(f"{name:<32}{seconds * 1000:>9.1f}{len(paths) / seconds:>12.0f}{legacy_s / seconds:>8.1f}x")
+
+if __name__ == "__main__":
+    bench()
@@ -0,0 +1,71 @@
+import os
+import sys
+import json
+import random
+from dotenv import load_dotenv
+load_dotenv()
+
+import google.generativeai as genai
+from app.services.github_service import detect_language
+from app.services.classifier_service import FileCategory, classify_path
+from app.services.token_service import CALIBRATION_PATH, count_pieces
+
+# Usage: python calibrate_tokens.py <checkout> [<checkout> ...]
+# Asks Gemini's count_tokens for a sample of files per language from local checkouts and
+# writes the pieces -> tokens factor token_service.estimate_tokens uses per language.
+SAMPLES_PER_LANGUAGE = 40
+MAX_SAMPLE_CHARS = 200000
+
+def collect_samples(roots):
+    """Kept (non-IGNORE) source files per language, a random sample of each."""
+    by_language = {}
+    for root in roots:
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if d != '.git']
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                rel_path = os.path.relpath(path, root).replace(os.sep, '/')
+                if classify_path(rel_path) == FileCategory.IGNORE:
+                    continue
+                by_language.setdefault(detect_language(rel_path), []).append(path)
+    random.seed(0)
+    return {
+        language: random.sample(paths, min(len(paths), SAMPLES_PER_LANGUAGE))
+        for language, paths in by_language.items()
+    }
+
+def calibrate(roots):
+    genai.configure(api_key=os.environ["GOOGLE_API_KEY"])
+    model = genai.GenerativeModel('gemini-3-pro-preview')
+
+    factors = {}
+    all_pieces = all_tokens = 0
+    for language, paths in sorted(collect_samples(roots).items()):
+        pieces = tokens = 0
+        for path in paths:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    text = f.read(MAX_SAMPLE_CHARS)
+            except (UnicodeDecodeError, OSError):
+                continue
+            if not text.strip():
+                continue
+            pieces += count_pieces(text)
+            tokens += model.count_tokens(text).total_tokens
+        if pieces:
+            factors[language] = round(tokens / pieces, 4)
+            all_pieces += pieces
+            all_tokens += tokens
+            print(f"{language:<16}{len(paths):>5} files{tokens:>10} tokens{factors[language]:>9} tokens/piece")
+    if not all_pieces:
+        sys.exit("No readable source files found")
+    factors['default'] = round(all_tokens / all_pieces, 4)
+
+    with open(CALIBRATION_PATH, 'w', encoding='utf-8') as f:
+        json.dump({'model': model.model_name, 'tokens_per_piece': factors}, f, indent=2, sort_keys=True)
+    print(f"Wrote {CALIBRATION_PATH} (default {factors['default']} tokens/piece)")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("Usage: python calibrate_tokens.py <checkout> [<checkout> ...]")
+    calibrate(sys.argv[1:])
@@ -12,6 +12,9 @@ $image = "gcr.io/$projectId/$serviceName"
 # $env:GOOGLE_CLOUD_TTS_JSON = '{"type":"service_account", ...}'
 
 # Deploy to Cloud Run
+# Roasts keep running after /ignite has answered, and their job state is local to the
+# instance: --no-cpu-throttling keeps CPU allocated between requests, and session
+# affinity sends a browser's polls back to the instance running its job.
 & "C:\Users\D.SAI CHARAN\AppData\Local\Google\Cloud SDK\google-cloud-sdk\bin\gcloud.cmd" run deploy $serviceName `
   --image $image `
   --platform managed `
@@ -19,6 +22,8 @@ $image = "gcr.io/$projectId/$serviceName"
   --allow-unauthenticated `
   --memory 2Gi `
   --timeout 300 `
+  --no-cpu-throttling `
+  --session-affinity `
   --update-env-vars SECRET_KEY="$env:SECRET_KEY" `
   --update-env-vars GOOGLE_API_KEY="$env:GOOGLE_API_KEY" `
   --update-env-vars GOOGLE_CLOUD_TTS_JSON="$env:GOOGLE_CLOUD_TTS_JSON"
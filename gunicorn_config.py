@@ -10,9 +10,12 @@ bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
 backlog = 2048
 
 # Worker processes
-workers = multiprocessing.cpu_count() * 2 + 1
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
 worker_class = 'gthread'  # Threaded worker for stability
-threads = 4  # Number of threads per worker
+threads = int(os.getenv('GUNICORN_THREADS', '4'))  # Number of threads per worker
+# Each worker admits ROAST_MAX_CONCURRENT pipelines (default: GUNICORN_THREADS) and queues
+# up to ROAST_MAX_QUEUE more; see app/services/scheduler_service.py
+os.environ.setdefault('GUNICORN_THREADS', str(threads))
 worker_connections = 1000
 timeout = 120  # Increased for long-running AI requests
 keepalive = 5